@@ -0,0 +1,141 @@
+"""
+Convert data/heatmap.json (or, with --items-key features, data/heatmap.geojson)
+to newline-delimited JSON for load_heatmap.py.
+
+The first line holds the top-level header fields ({"metadata": {...}}), every
+following line is one element of the items array. Each line can be decoded on
+its own, so the loader never has to hold the full array in memory.
+
+With --shards N the data items are split by time_bucket into N files
+(heatmap.part0.ndjson, ...) that load_heatmap.py inserts in parallel. Each
+shard's header line also records its index and the shard count ("shard",
+"shards"), and shards left over from an earlier run are deleted first.
+"""
+
+import os
+import glob
+import json
+import zlib
+import argparse
+
+# Try to import ijson for streaming the input, fall back to json.load
+try:
+    import ijson
+    HAS_IJSON = True
+except ImportError:
+    HAS_IJSON = False
+
+# Try to import orjson for faster serialization, fall back to json
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+def dumps_line(obj):
+    """Serialize one object as a single NDJSON line (bytes, newline included)."""
+    if HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def shard_paths(output_file, shards):
+    """Return the per-shard output paths for output_file (name.partI.ext)."""
+    base, ext = os.path.splitext(output_file)
+    return [f"{base}.part{i}{ext}" for i in range(shards)]
+
+
+def existing_shard_paths(output_file):
+    """Return the shard files of any earlier run for output_file."""
+    base, ext = os.path.splitext(output_file)
+    return glob.glob(f"{glob.escape(base)}.part*{ext}")
+
+
+def shard_of(item, shards):
+    """Pick the shard for a data item by its time bucket (stable across runs)."""
+    return zlib.crc32(str(item.get('time_bucket')).encode('utf-8')) % shards
+
+
+def convert_to_ndjson(input_file, output_file, items_key='data', header_keys=('metadata',), shards=1):
+    """
+    Write the header fields and items of input_file to output_file as NDJSON.
+
+    With shards > 1 the items are spread over shard_paths(output_file, shards),
+    each starting with the header plus its shard index and the shard count.
+    Existing shard files for output_file are removed first either way, so a
+    smaller or unsharded run leaves none behind for the loader to pick up.
+    """
+    print(f"Converting {input_file} -> {output_file}...")
+
+    if HAS_IJSON:
+        header = {}
+        for key in header_keys:
+            with open(input_file, 'rb') as f:
+                value = next(ijson.items(f, key, use_float=True), None)
+            if value is not None:
+                header[key] = value
+
+        def items():
+            with open(input_file, 'rb') as f:
+                yield from ijson.items(f, f'{items_key}.item', use_float=True)
+
+        item_iter = items()
+    else:
+        with open(input_file, 'r') as f:
+            data = json.load(f)
+        header = {key: data[key] for key in header_keys if key in data}
+        item_iter = iter(data.get(items_key, []))
+
+    for path in existing_shard_paths(output_file):
+        os.remove(path)
+
+    if shards > 1:
+        outputs = [open(path, 'wb') for path in shard_paths(output_file, shards)]
+        headers = [dict(header, shard=i, shards=shards) for i in range(shards)]
+    else:
+        outputs = [open(output_file, 'wb')]
+        headers = [header]
+
+    count = 0
+    try:
+        for out, out_header in zip(outputs, headers):
+            out.write(dumps_line(out_header))
+        for item in item_iter:
+            out = outputs[shard_of(item, shards)] if shards > 1 else outputs[0]
+            out.write(dumps_line(item))
+            count += 1
+    finally:
+        for out in outputs:
+            out.close()
+
+    written_to = ', '.join(out.name for out in outputs)
+    print(f"✓ Wrote header and {count:,} items to {written_to}")
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert heatmap JSON to NDJSON')
+    parser.add_argument('--input', help='Input heatmap JSON file path (default: data/heatmap.json, '
+                                         'or data/heatmap.geojson with --items-key features)')
+    parser.add_argument('--output', help='Output NDJSON file path (default: data/heatmap.ndjson, '
+                                         'or data/heatmap.geojson.ndjson with --items-key features)')
+    parser.add_argument('--items-key', default='data', help="Top-level array to split into lines ('data' or 'features')")
+    parser.add_argument('--shards', type=int, default=1, help='Split data items by time_bucket into this many files')
+
+    args = parser.parse_args()
+
+    # load_heatmap.py only loads data shards; features are read from a single file
+    if args.shards > 1 and args.items_key != 'data':
+        parser.error('--shards is only supported with --items-key data')
+
+    # load_heatmap.py picks up data/heatmap.ndjson and data/heatmap.geojson.ndjson
+    if args.items_key == 'features':
+        input_file = args.input or 'data/heatmap.geojson'
+        output_file = args.output or 'data/heatmap.geojson.ndjson'
+        header_keys = ('type', 'metadata')
+    else:
+        input_file = args.input or 'data/heatmap.json'
+        output_file = args.output or 'data/heatmap.ndjson'
+        header_keys = ('metadata',)
+    convert_to_ndjson(input_file, output_file, args.items_key, header_keys, args.shards)
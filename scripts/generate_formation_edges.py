@@ -1,11 +1,22 @@
 import pymongo
-from pymongo import MongoClient
+from pymongo import MongoClient, IndexModel
+from pymongo.write_concern import WriteConcern
+from bson import ObjectId
+from bson.raw_bson import RawBSONDocument
 from datetime import datetime, timedelta
 import os
 import sys
 import math
 import time
-from collections import defaultdict
+import calendar
+import multiprocessing
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from queue import Queue
+from threading import Thread
+import numpy as np
 
 # Try to import tqdm for progress bar, but make it optional
 try:
@@ -16,6 +27,28 @@ except ImportError:
     def tqdm(iterable, **kwargs):
         return iterable
 
+# Try to import ciso8601 (C ISO-8601 parser) for string timestamps, but make it optional
+try:
+    from ciso8601 import parse_datetime as parse_iso_timestamp
+except ImportError:
+    def parse_iso_timestamp(timestamp):
+        return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+# Try to import numba to JIT-compile the pair-scoring kernel, but make it optional
+try:
+    import numba
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# Try to import scipy's k-d tree for the 'kdtree' candidate search, but make it optional
+try:
+    from scipy.spatial import cKDTree
+    HAS_SCIPY = True
+except ImportError:
+    HAS_SCIPY = False
+
 print("="*60)
 print("STEP 5: Generate Candidate Formation Edges")
 print("="*60)
@@ -40,6 +73,10 @@ MAX_DISTANCE_KM = 50  # Maximum distance in kilometers (increased to reduce quer
 MAX_TIME_DIFF_MINUTES = 20  # Maximum time difference in minutes (±30 min, generalized for heatmap)
 MAX_CANDIDATES_PER_NODE = int(os.getenv('MAX_CANDIDATES_PER_NODE', '20'))  # Limit candidates per node (can be reduced for speed)
 COMPUTE_HEADING = False  # Whether to compute heading similarity (disabled for speed)
+# Store node1_id/node2_id on edges (raw ObjectIds: 12 bytes in BSON vs a 24-char hex string)
+STORE_NODE_IDS = os.getenv('STORE_NODE_IDS', '').lower() in ('1', 'true', 'yes')
+# Candidates whose best reachable score is below this are skipped before heading lookups
+MIN_SCORE_TO_STORE = float(os.getenv('MIN_SCORE_TO_STORE', '0.5'))
 
 # Optional: Limit number of nodes to process (for testing)
 # Set to None to process all nodes
@@ -54,11 +91,44 @@ else:
 # Higher = faster but less coverage (good for heatmap)
 NODE_SAMPLING_RATE = int(os.getenv('NODE_SAMPLING_RATE', '10'))  # Default: every 10th node for speed
 
+# Nodes are read in time bins of BIN_MINUTES, the next bin prefetched while one is processed
+BIN_MINUTES = int(os.getenv('BIN_MINUTES', '30'))
+# Node order of every time-sorted read, served by the (timestamp, flight_id) index
+TIME_ORDER = [('timestamp', 1), ('flight_id', 1)]
+# Node fields read for pairing; location GeoJSON and flight metadata are never shipped.
+# _id is only needed for node ids on edges and heading lookups
+NODE_FIELDS = {'lat': 1, 'lon': 1, 'timestamp': 1, 'flight_id': 1, 'heading': 1}
+if not (STORE_NODE_IDS or COMPUTE_HEADING):
+    NODE_FIELDS['_id'] = 0
+
+# Edge writes: documents per insert_many, and whether to skip write acknowledgements (w=0).
+# Unacknowledged writes do not wait for the server but also do not report insert errors
+EDGE_BATCH_SIZE = int(os.getenv('EDGE_BATCH_SIZE', '50000'))
+UNACKNOWLEDGED_WRITES = os.getenv('UNACKNOWLEDGED_WRITES', '').lower() in ('1', 'true', 'yes')
+
+# Parallelism: the time range is split into slabs of at most SLAB_MINUTES (and at least
+# NUM_WORKERS slabs), processed by NUM_WORKERS separate processes. Slabs much longer than
+# MAX_TIME_DIFF_MINUTES keep the re-read halo small; more slabs than workers balance busy hours
+NUM_WORKERS = int(os.getenv('NUM_WORKERS', str(os.cpu_count() or 1)))
+SLAB_MINUTES = int(os.getenv('SLAB_MINUTES', '720'))
+
+# Candidate search: 'window' pairs nodes in-process from a sliding time window,
+# 'kdtree' queries a k-d tree of the window on 3D unit vectors (needs scipy),
+# 'geo' issues a per-node $geoWithin query (lower client memory, more round-trips)
+CANDIDATE_SEARCH = os.getenv('CANDIDATE_SEARCH', 'window')
+if CANDIDATE_SEARCH == 'kdtree' and not HAS_SCIPY:
+    print("⚠ scipy not installed, falling back to CANDIDATE_SEARCH=window")
+    CANDIDATE_SEARCH = 'window'
+# Nodes per block for the compiled pair kernel (window search with numba) and the k-d tree
+NODE_BLOCK_SIZE = int(os.getenv('NODE_BLOCK_SIZE', '4096'))
+
 print(f"\nConfiguration:")
 print(f"  Max distance: {MAX_DISTANCE_KM} km")
 print(f"  Max time difference: ±{MAX_TIME_DIFF_MINUTES} minutes")
 print(f"  Max candidates per node: {MAX_CANDIDATES_PER_NODE}")
 print(f"  Compute heading similarity: {COMPUTE_HEADING}")
+print(f"  Min feasibility score to store: {MIN_SCORE_TO_STORE}")
+print(f"  Store node ids on edges: {STORE_NODE_IDS}")
 if MAX_NODES_TO_PROCESS:
     print(f"  ⚠ LIMIT: Processing only first {MAX_NODES_TO_PROCESS:,} nodes (TEST MODE)")
 if NODE_SAMPLING_RATE > 1:
@@ -66,27 +136,42 @@ if NODE_SAMPLING_RATE > 1:
     print(f"    → Use NODE_SAMPLING_RATE=1 to process all nodes")
 else:
     print(f"  Processing all nodes (no sampling)")
+print(f"  Edge batch size: {EDGE_BATCH_SIZE:,}{' (unacknowledged writes)' if UNACKNOWLEDGED_WRITES else ''}")
+print(f"  Worker processes: {NUM_WORKERS} (time slabs of up to {SLAB_MINUTES} minutes)")
+print(f"  Candidate search: {CANDIDATE_SEARCH}")
+if CANDIDATE_SEARCH == 'window':
+    print(f"  Pair kernel: {'numba (blocks of ' + str(NODE_BLOCK_SIZE) + ' nodes)' if HAS_NUMBA else 'numpy'}")
 
-# Connect to MongoDB with connection pooling for better performance
-print(f"\nConnecting to MongoDB...")
-try:
+IS_LOCAL_MONGO = 'localhost' in MONGO_URI or '127.0.0.1' in MONGO_URI
+
+def open_client():
+    """
+    Open a MongoClient with connection pooling.
+    Each worker process opens its own client (clients are not fork-safe).
+    Atlas connections compress wire traffic; compressors whose Python module is
+    not installed (snappy, zstd) are skipped by the driver, zlib is always available.
+    """
     # Use longer timeout for Atlas connections + connection pooling
-    if 'localhost' in MONGO_URI or '127.0.0.1' in MONGO_URI:
-        client = MongoClient(
+    if IS_LOCAL_MONGO:
+        return MongoClient(
             MONGO_URI, 
             serverSelectionTimeoutMS=3000,
             maxPoolSize=50,  # Connection pooling for concurrent operations
             minPoolSize=10
         )
-        connection_type = "local MongoDB"
-    else:
-        client = MongoClient(
-            MONGO_URI, 
-            serverSelectionTimeoutMS=10000,
-            maxPoolSize=50,  # Connection pooling for better performance
-            minPoolSize=10
-        )
-        connection_type = "MongoDB Atlas"
+    return MongoClient(
+        MONGO_URI, 
+        serverSelectionTimeoutMS=10000,
+        maxPoolSize=50,  # Connection pooling for better performance
+        minPoolSize=10,
+        compressors='snappy,zstd,zlib'  # Edge batches are mostly repeated keys and numbers
+    )
+
+# Connect to MongoDB with connection pooling for better performance
+print(f"\nConnecting to MongoDB...")
+try:
+    client = open_client()
+    connection_type = "local MongoDB" if IS_LOCAL_MONGO else "MongoDB Atlas"
     
     client.admin.command('ping')
     print(f"✓ Connected to {connection_type}")
@@ -113,16 +198,25 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     Calculate the great circle distance between two points on Earth (in km).
     Uses Haversine formula.
     """
+    phi1 = math.radians(lat1)
+    return haversine_distance_precomp(phi1, math.cos(phi1), math.radians(lon1), lat2, lon2)
+
+def haversine_distance_precomp(phi1, cos_phi1, lam1, lat2, lon2):
+    """
+    Haversine distance (km) from a point given as precomputed radians
+    (phi1, cos(phi1), lam1) to (lat2, lon2) in degrees.
+    The first point is fixed for all candidates of a node, so its trig is
+    computed once per node instead of once per pair.
+    """
     R = 6371  # Earth radius in kilometers
     
-    phi1 = math.radians(lat1)
     phi2 = math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
+    delta_phi = phi2 - phi1
+    delta_lambda = math.radians(lon2) - lam1
     
     a = (math.sin(delta_phi / 2) ** 2 +
-         math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+         cos_phi1 * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2)
+    c = 2 * math.asin(math.sqrt(min(1.0, a)))  # One sqrt + asin instead of two sqrt + atan2
     
     return R * c
 
@@ -162,7 +256,23 @@ def heading_similarity(heading1, heading2):
     similarity = 1.0 - (diff / 180.0)
     return max(0.0, similarity)
 
-def compute_feasibility_score(node1, node2, distance_km, time_diff_seconds, heading_sim=None):
+# Score normalizers, hoisted out of the per-pair scoring functions
+INV_MAX_DISTANCE_KM = 1.0 / MAX_DISTANCE_KM
+INV_MAX_TIME_SECONDS = 1.0 / (MAX_TIME_DIFF_MINUTES * 60)
+
+def distance_time_scores(distance_km, time_diff_seconds):
+    """
+    Distance and time components (each 0-1) of the feasibility score.
+    """
+    # Distance score (0-1): closer is better
+    distance_score = max(0.0, 1.0 - distance_km * INV_MAX_DISTANCE_KM)
+    
+    # Time score (0-1): closer in time is better
+    time_score = max(0.0, 1.0 - abs(time_diff_seconds) * INV_MAX_TIME_SECONDS)
+    
+    return distance_score, time_score
+
+def compute_feasibility_score(distance_km, time_diff_seconds, heading_sim=None):
     """
     Compute a feasibility score (0-1) for formation between two nodes.
     
@@ -171,14 +281,7 @@ def compute_feasibility_score(node1, node2, distance_km, time_diff_seconds, head
     - Time difference (closer in time = better)
     - Heading similarity (optional, similar = better)
     """
-    # Distance score (0-1): closer is better
-    max_dist = MAX_DISTANCE_KM * 1000  # Convert to meters for calculation
-    distance_m = distance_km * 1000
-    distance_score = max(0.0, 1.0 - (distance_m / max_dist))
-    
-    # Time score (0-1): closer in time is better
-    max_time_sec = MAX_TIME_DIFF_MINUTES * 60
-    time_score = max(0.0, 1.0 - (abs(time_diff_seconds) / max_time_sec))
+    distance_score, time_score = distance_time_scores(distance_km, time_diff_seconds)
     
     # Combined base score
     if heading_sim is not None and COMPUTE_HEADING:
@@ -190,6 +293,48 @@ def compute_feasibility_score(node1, node2, distance_km, time_diff_seconds, head
     
     return score
 
+def feasibility_scores(distances_km, time_diffs_seconds):
+    """
+    Vectorized distance/time feasibility scores (the 50/50 weighting of
+    compute_feasibility_score without heading) for arrays of candidates.
+    """
+    distance_scores = np.maximum(0.0, 1.0 - distances_km * INV_MAX_DISTANCE_KM)
+    time_scores = np.maximum(0.0, 1.0 - np.abs(time_diffs_seconds) * INV_MAX_TIME_SECONDS)
+    return 0.5 * distance_scores + 0.5 * time_scores
+
+def feasibility_upper_bound(base_score):
+    """
+    Best feasibility score reachable from a distance/time score (scalar or array).
+    With headings enabled this assumes a perfect heading match
+    (0.4 * distance + 0.4 * time + 0.2 == 0.8 * base + 0.2), so it bounds
+    compute_feasibility_score from above without any heading lookups.
+    """
+    if COMPUTE_HEADING:
+        return 0.8 * base_score + 0.2
+    return base_score
+
+@lru_cache(maxsize=65536)
+def parse_timestamp(timestamp):
+    """
+    Parse an ISO timestamp string (cached: nodes of one time step share strings).
+    """
+    return parse_iso_timestamp(timestamp)
+
+def epoch_seconds(timestamp):
+    """
+    Seconds since the Unix epoch (naive datetimes are UTC, as stored by BSON).
+    """
+    return calendar.timegm(timestamp.utctimetuple()) + timestamp.microsecond / 1e6
+
+def to_datetime(timestamp):
+    """
+    Normalize a node timestamp to a datetime (nodes may store ISO strings).
+    BSON datetimes are already decoded by the driver and pass straight through.
+    """
+    if isinstance(timestamp, str):
+        return parse_timestamp(timestamp)
+    return timestamp
+
 def get_flight_trajectory_info(collection, flight_id, timestamp):
     """
     Get previous and next nodes for the same flight to calculate heading.
@@ -215,10 +360,21 @@ def get_flight_trajectory_info(collection, flight_id, timestamp):
     
     return prev_node, next_node
 
-def calculate_node_heading(collection, node):
+def calculate_node_heading(collection, node, known_headings=None):
     """
     Calculate the heading of a flight at a given node based on trajectory.
+    Nodes loaded with an ADS-B heading, or found in known_headings (node _id ->
+    heading, see precompute_headings), use it directly (no trajectory queries).
+    Headings computed from the trajectory are added to known_headings, so each
+    node costs at most one pair of queries however many pairs it appears in.
     """
+    heading = node.get('heading')
+    if heading is not None:
+        return heading
+    node_id = node.get('_id')
+    if known_headings is not None and node_id in known_headings:
+        return known_headings[node_id]
+    
     flight_id = node['flight_id']
     timestamp = node['timestamp']
     lat = node['lat']
@@ -228,11 +384,808 @@ def calculate_node_heading(collection, node):
     
     # Use next node if available, otherwise previous node
     if next_node:
-        return calculate_heading(lat, lon, next_node['lat'], next_node['lon'])
+        heading = calculate_heading(lat, lon, next_node['lat'], next_node['lon'])
     elif prev_node:
-        return calculate_heading(prev_node['lat'], prev_node['lon'], lat, lon)
+        heading = calculate_heading(prev_node['lat'], prev_node['lon'], lat, lon)
+    
+    if known_headings is not None and node_id is not None:
+        known_headings[node_id] = heading
+    return heading
+
+def precompute_headings(collection, start, end):
+    """
+    Headings of the nodes with timestamps in [start, end], keyed by node _id.
+    
+    One $setWindowFields pass pairs each node with the next point of its flight
+    and the bearings are computed in a single NumPy call, replacing the two
+    trajectory queries per node of calculate_node_heading. Nodes whose next point
+    lies outside the range (flight end, range edge) are left out and still fall
+    back to the queries.
+    """
+    node_ids, lats, lons, next_lats, next_lons = [], [], [], [], []
+    try:
+        cursor = collection.aggregate([
+            {'$match': {'timestamp': {'$gte': start, '$lte': end}}},
+            {'$setWindowFields': {
+                'partitionBy': '$flight_id',
+                'sortBy': {'timestamp': 1},
+                'output': {
+                    'next_lat': {'$shift': {'output': '$lat', 'by': 1}},
+                    'next_lon': {'$shift': {'output': '$lon', 'by': 1}},
+                },
+            }},
+            {'$match': {'next_lat': {'$ne': None}}},
+            {'$project': {'lat': 1, 'lon': 1, 'next_lat': 1, 'next_lon': 1}},
+        ], allowDiskUse=True, batchSize=10000)
+        for doc in cursor:
+            node_ids.append(doc['_id'])
+            lats.append(doc['lat'])
+            lons.append(doc['lon'])
+            next_lats.append(doc['next_lat'])
+            next_lons.append(doc['next_lon'])
+    except Exception as e:
+        print(f"\nWarning: Could not precompute headings: {e}")
+        print("  Falling back to per-node trajectory queries (cached by node)")
+        return {}
+    
+    # Initial bearing to the next point (same formula as calculate_heading)
+    phi1 = np.radians(np.array(lats, dtype=np.float64))
+    phi2 = np.radians(np.array(next_lats, dtype=np.float64))
+    delta_lambda = np.radians(np.array(next_lons, dtype=np.float64) - np.array(lons, dtype=np.float64))
+    y = np.sin(delta_lambda) * np.cos(phi2)
+    x = np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(delta_lambda)
+    headings = np.degrees(np.arctan2(y, x)) % 360
+    
+    return dict(zip(node_ids, headings.tolist()))
+
+# Equirectangular prefilter: below PREFILTER_MAX_LAT, the flat distance (in degrees,
+# longitude scaled by the smaller cos(lat) of the pair) never exceeds the great-circle
+# distance by more than PREFILTER_SLACK, so points beyond it are rejected without trig.
+# Nearer the poles every point goes to the haversine
+PREFILTER_SLACK = 1.02
+PREFILTER_MAX_LAT = 80
+KM_PER_DEGREE = 6371 * math.pi / 180
+
+def equirectangular_within(lat1, lon1, cos_phi1, lats, lons, cos_lats, out, tmp):
+    """
+    Mask of the points that may lie within MAX_DISTANCE_KM of (lat1, lon1),
+    from the equirectangular approximation (subtractions and products only).
+    Uses the preallocated scratch buffers out and tmp.
+    """
+    limit = MAX_DISTANCE_KM * PREFILTER_SLACK / KM_PER_DEGREE
+    
+    # (delta_lambda * cos)^2, with delta_lambda wrapped across ±180°
+    np.subtract(lons, lon1, out=out)
+    np.abs(out, out=out)
+    np.subtract(360, out, out=tmp)
+    np.minimum(out, tmp, out=out)
+    np.minimum(cos_lats, cos_phi1, out=tmp)
+    np.multiply(out, tmp, out=out)
+    np.square(out, out=out)
+    
+    # + delta_phi^2
+    np.subtract(lats, lat1, out=tmp)
+    np.square(tmp, out=tmp)
+    np.add(out, tmp, out=out)
+    return out <= limit * limit
+
+def haversine_distances(lat1, lon1, cos_phi1, lats, lons, cos_lats, out, tmp):
+    """
+    Haversine distance (km) from one point (with precomputed cos(phi1))
+    to arrays of points with their precomputed cosines of latitude (cos_lats).
+    Computed in place in the dtype of the preallocated scratch buffers
+    (out, tmp), so float32 windows stay float32 end to end.
+    """
+    R = 6371  # Earth radius in kilometers
+    half_rad = math.pi / 360  # Degrees -> radians, halved
+    
+    # sin^2(delta_phi / 2)
+    np.subtract(lats, lat1, out=out)
+    np.multiply(out, half_rad, out=out)
+    np.sin(out, out=out)
+    np.square(out, out=out)
+    
+    # cos(phi1) * cos(phi2) * sin^2(delta_lambda / 2)
+    np.subtract(lons, lon1, out=tmp)
+    np.multiply(tmp, half_rad, out=tmp)
+    np.sin(tmp, out=tmp)
+    np.square(tmp, out=tmp)
+    np.multiply(tmp, cos_lats, out=tmp)
+    np.multiply(tmp, cos_phi1, out=tmp)
+    
+    # c = 2 * asin(sqrt(a))
+    np.add(out, tmp, out=out)
+    np.minimum(out, 1.0, out=out)
+    np.sqrt(out, out=out)
+    np.arcsin(out, out=out)
+    np.multiply(out, 2 * R, out=out)
+    return out
+
+class CandidateWindow:
+    """
+    Sliding time window of candidate nodes, stored as struct-of-arrays buffers.
+    
+    Coordinates and headings are float32 (distances are only compared at km
+    resolution), halving the bytes moved by the per-node distance pass. The active
+    window is the contiguous slice [start:end]: evicting advances start, and the
+    buffers are compacted (or doubled) when an append reaches the end. Scratch
+    buffers for the distance pass are allocated alongside and reused for every node.
+    
+    A uniform lat/lon grid (cells at least MAX_DISTANCE_KM tall) maps each cell to
+    the sequence numbers of its nodes, so a query only measures distances to nodes
+    in the neighbouring cells instead of the whole window. Sequence numbers are
+    absolute (base + buffer index) and survive compaction; evicted ones are
+    dropped lazily from the front of each cell.
+    """
+    
+    COLUMNS = ('timestamps', 'times', 'lat', 'lon', 'cos_lat', 'flight_ids', 'node_ids', 'headings', 'heading_known')
+    CELL_DEG = MAX_DISTANCE_KM / 110.574  # Shortest length of a degree of latitude (km)
+    LON_CELLS = max(1, int(360 // CELL_DEG))
+    LON_CELL_DEG = 360 / LON_CELLS  # Equal-width longitude cells so the ±180° seam wraps cleanly
+    
+    def __init__(self, collection, source, known_headings=None, capacity=65536):
+        self.collection = collection  # Used for heading lookups
+        self.known_headings = known_headings  # Precomputed headings by node _id
+        self.source = source  # Time-sorted cursor feeding the right of the window
+        self.next_node = next(source, None)  # Peeked node not yet in the window
+        self.start = 0
+        self.end = 0
+        self.base = 0  # Sequence number of buffer index 0
+        self.grid = defaultdict(deque)  # (lat_cell, lon_cell) -> sequence numbers
+        self.timestamps = np.empty(capacity, dtype=object)
+        self.times = np.empty(capacity, dtype=np.float64)  # Epoch seconds, for vectorized time diffs
+        self.lat = np.empty(capacity, dtype=np.float32)
+        self.lon = np.empty(capacity, dtype=np.float32)
+        self.cos_lat = np.empty(capacity, dtype=np.float32)  # Computed once per node, not per pair
+        self.flight_ids = np.empty(capacity, dtype=np.int64)
+        self.node_ids = np.empty(capacity, dtype=object)
+        self.headings = np.empty(capacity, dtype=np.float32)  # NaN when unavailable
+        self.heading_known = np.empty(capacity, dtype=bool)  # Headings are computed on first use
+        self.scratch = np.empty((5, capacity), dtype=np.float32)
+    
+    def __len__(self):
+        return self.end - self.start
+    
+    def _make_room(self):
+        """Move the active slice to the front, doubling capacity if over half full."""
+        size = len(self)
+        capacity = len(self.lat)
+        if size * 2 > capacity:
+            capacity *= 2
+            self.scratch = np.empty((5, capacity), dtype=np.float32)
+        
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            if len(column) != capacity:
+                resized = np.empty(capacity, dtype=column.dtype)
+                resized[:size] = column[self.start:self.end]
+                setattr(self, name, resized)
+            else:
+                column[:size] = column[self.start:self.end]
+        
+        self.base += self.start
+        self.start = 0
+        self.end = size
+        
+        # Sweep evicted sequence numbers out of cells that were not queried since
+        for cell in list(self.grid):
+            self._expire(cell)
+    
+    def _cell(self, lat, lon):
+        """Grid cell (lat_cell, lon_cell) containing a point."""
+        return (int((lat + 90) // self.CELL_DEG),
+                int((lon + 180) // self.LON_CELL_DEG) % self.LON_CELLS)
+    
+    def _expire(self, cell):
+        """Drop evicted sequence numbers from the front of a cell (and empty cells)."""
+        seqs = self.grid[cell]
+        first_live = self.base + self.start
+        while seqs and seqs[0] < first_live:
+            seqs.popleft()
+        if not seqs:
+            del self.grid[cell]
+            return None
+        return seqs
+    
+    def append(self, node):
+        """Push a node document onto the right of the window."""
+        if self.end == len(self.lat):
+            self._make_room()
+        
+        i = self.end
+        self.timestamps[i] = to_datetime(node['timestamp'])
+        self.times[i] = epoch_seconds(self.timestamps[i])
+        self.lat[i] = node['lat']
+        self.lon[i] = node['lon']
+        self.cos_lat[i] = math.cos(math.radians(node['lat']))
+        self.flight_ids[i] = node['flight_id']
+        self.node_ids[i] = node.get('_id')
+        heading = node.get('heading')  # Stored ADS-B heading, when the loader kept one
+        self.headings[i] = np.nan if heading is None else heading
+        self.heading_known[i] = heading is not None
+        self.grid[self._cell(node['lat'], node['lon'])].append(self.base + i)
+        self.end += 1
+    
+    def advance_to(self, timestamp):
+        """Push source nodes up to and including timestamp onto the window."""
+        while self.next_node is not None and to_datetime(self.next_node['timestamp']) <= timestamp:
+            self.append(self.next_node)
+            self.next_node = next(self.source, None)
+    
+    def heading(self, i):
+        """Heading of the node at buffer index i (None if unavailable), computed once."""
+        if not self.heading_known[i]:
+            heading = calculate_node_heading(self.collection, {
+                '_id': self.node_ids[i],
+                'flight_id': int(self.flight_ids[i]),
+                'timestamp': self.timestamps[i],
+                'lat': float(self.lat[i]),
+                'lon': float(self.lon[i]),
+            }, self.known_headings)
+            self.headings[i] = np.nan if heading is None else heading
+            self.heading_known[i] = True
+        
+        heading = float(self.headings[i])
+        return None if math.isnan(heading) else heading
+    
+    def evict_before(self, timestamp):
+        """Pop nodes older than timestamp from the left of the window."""
+        while self.start < self.end and self.timestamps[self.start] < timestamp:
+            self.timestamps[self.start] = None  # Release references held by the buffer
+            self.node_ids[self.start] = None
+            self.start += 1
+    
+    def neighborhood(self, lat, lon, cos_lat):
+        """
+        Buffer indices of live nodes in the grid cells that can hold points within
+        MAX_DISTANCE_KM of (lat, lon); cos_lat is the precomputed cosine of lat.
+        """
+        lat_cell, lon_cell = self._cell(lat, lon)
+        
+        # Degrees of longitude spanned by MAX_DISTANCE_KM shrink with cos(latitude):
+        # size the reach for the most poleward latitude of the neighbourhood
+        cos_far = min(cos_lat, math.cos(math.radians(min(89.9, abs(lat) + self.CELL_DEG))))
+        lon_reach = math.ceil(MAX_DISTANCE_KM / (111.32 * max(cos_far, 1e-6)) / self.LON_CELL_DEG)
+        if 2 * lon_reach + 1 >= self.LON_CELLS:
+            lon_cells = range(self.LON_CELLS)
+        else:
+            lon_cells = [(lon_cell + d) % self.LON_CELLS for d in range(-lon_reach, lon_reach + 1)]
+        
+        seqs = []
+        for cell_lat in (lat_cell - 1, lat_cell, lat_cell + 1):
+            for cell_lon in lon_cells:
+                cell = (cell_lat, cell_lon)
+                if cell in self.grid:
+                    live = self._expire(cell)
+                    if live:
+                        seqs.extend(live)
+        
+        return np.fromiter(seqs, dtype=np.int64, count=len(seqs)) - self.base
+    
+    def nearest(self, lat, lon, cos_lat, time, flight_id, k):
+        """
+        Find up to k window nodes of later flights (flight_id greater than the
+        node's, so each pair is produced once) within MAX_DISTANCE_KM of (lat, lon)
+        whose score bound reaches MIN_SCORE_TO_STORE, keeping the best scores.
+        cos_lat is the precomputed cosine of lat (in radians); time is epoch seconds.
+        Returns (buffer indices, distances in km, time diffs in s, base scores).
+        """
+        indices = self.neighborhood(lat, lon, cos_lat)
+        
+        # Grid cells are square-ish boxes: drop their corners before the haversine
+        if abs(lat) + self.CELL_DEG < PREFILTER_MAX_LAT:
+            n = len(indices)
+            near = equirectangular_within(
+                lat, lon, cos_lat,
+                np.take(self.lat, indices, out=self.scratch[0, :n]),
+                np.take(self.lon, indices, out=self.scratch[1, :n]),
+                np.take(self.cos_lat, indices, out=self.scratch[2, :n]),
+                self.scratch[3, :n], self.scratch[4, :n]
+            )
+            indices = indices[near]
+        
+        return self.select(indices, lat, lon, cos_lat, time, flight_id, k)
+    
+    def select(self, indices, lat, lon, cos_lat, time, flight_id, k):
+        """Score the window nodes at buffer indices against a node, as in nearest()."""
+        n = len(indices)
+        
+        lats = np.take(self.lat, indices, out=self.scratch[0, :n])
+        lons = np.take(self.lon, indices, out=self.scratch[1, :n])
+        cos_lats = np.take(self.cos_lat, indices, out=self.scratch[2, :n])
+        distances = haversine_distances(
+            lat, lon, cos_lat, lats, lons, cos_lats, self.scratch[3, :n], self.scratch[4, :n]
+        )
+        time_diffs = self.times[indices] - time
+        scores = feasibility_scores(distances, time_diffs)
+        
+        mask = distances <= MAX_DISTANCE_KM
+        mask &= np.abs(time_diffs) <= MAX_TIME_DIFF_MINUTES * 60  # Blocks slide the window wider than one node's range
+        mask &= self.flight_ids[indices] > flight_id
+        mask &= feasibility_upper_bound(scores) >= MIN_SCORE_TO_STORE
+        nearby = np.flatnonzero(mask)
+        if len(nearby) > k:
+            # Best k scores without a full sort
+            nearby = nearby[np.argpartition(-scores[nearby], k)[:k]]
+        
+        return indices[nearby], distances[nearby], time_diffs[nearby], scores[nearby]
+
+# Edge document fields, in storage order (simplified for speed - minimal fields for heatmap)
+# node1_id/node2_id are appended when STORE_NODE_IDS is set; other optional fields
+# (left out for speed): heading1, heading2, heading_similarity, created_at
+# Distance and score are stored as fixed-point int32 (distance_km_i = km * 100,
+# feasibility_score_i = score * 10000): the same 2 and 4 decimals as before in half the bytes
+EDGE_FIELDS = ('flight1_id', 'flight2_id', 'timestamp1', 'timestamp2',
+               'time_diff_seconds', 'distance_km_i', 'feasibility_score_i')
+DISTANCE_SCALE = 100
+SCORE_SCALE = 10000
+if STORE_NODE_IDS:
+    EDGE_FIELDS += ('node1_id', 'node2_id')
+
+# BSON element types used by the columnar edge encoder
+BSON_DOUBLE = 0x01
+BSON_OBJECTID = 0x07
+BSON_DATETIME = 0x09
+BSON_INT32 = 0x10
+BSON_INT64 = 0x12
+
+def bson_int_column(values):
+    """
+    (BSON type, little-endian array) for an integer column: int32 when every
+    value fits, as the driver would encode Python ints, otherwise int64.
+    """
+    if len(values) and (values.min() < -2**31 or values.max() >= 2**31):
+        return BSON_INT64, values.astype('<i8')
+    return BSON_INT32, values.astype('<i4')
+
+def fixed_point(values, scale):
+    """
+    Round a float column to int32 fixed point (value * scale).
+    """
+    return np.rint(values * scale).astype('<i4')
+
+def bson_datetime_column(timestamps):
+    """
+    (BSON type, array) of UTC milliseconds since the epoch for a list of datetimes.
+    """
+    if any(ts.tzinfo is not None for ts in timestamps):
+        # Timezone-aware datetimes (parsed from ISO strings) have no NumPy representation:
+        # NumPy would warn and drop the offset, so convert them to UTC one by one
+        millis = np.array([calendar.timegm(ts.utctimetuple()) * 1000 + ts.microsecond // 1000
+                           for ts in timestamps], dtype='<i8')
     else:
-        return None
+        millis = np.array(timestamps, dtype='datetime64[ms]').astype('<i8')
+    return BSON_DATETIME, millis
+
+def encode_bson_documents(fields, columns):
+    """
+    Encode a batch of documents column by column into raw BSON.
+    
+    fields are the document keys and columns the matching (BSON type, NumPy
+    array) pairs. Every document has the same keys and fixed-size values, so the
+    batch is one packed structured array whose records are byte-for-byte BSON
+    documents (int32 length, type/name/value elements, terminating zero). The
+    driver sends RawBSONDocuments without re-encoding (the server assigns _id).
+    """
+    layout = [('size', '<i4')]
+    for k, (field, (_, values)) in enumerate(zip(fields, columns)):
+        layout += [(f't{k}', 'u1'), (f'n{k}', f'S{len(field) + 1}'), (f'v{k}', values.dtype)]
+    layout.append(('end', 'u1'))
+    
+    records = np.zeros(len(columns[0][1]), dtype=np.dtype(layout))  # Zeroed name terminators and end byte
+    records['size'] = records.dtype.itemsize
+    for k, (field, (bson_type, values)) in enumerate(zip(fields, columns)):
+        records[f't{k}'] = bson_type
+        records[f'n{k}'] = field.encode()
+        records[f'v{k}'] = values
+    
+    raw = records.tobytes()
+    size = records.dtype.itemsize
+    return [RawBSONDocument(raw[i:i + size]) for i in range(0, len(raw), size)]
+
+class EdgeBuffer:
+    """
+    Columnar (struct-of-arrays) buffer of edges waiting to be inserted.
+    
+    Edges are appended into preallocated per-field arrays instead of building a
+    dict per pair; fixed-point rounding is applied to whole columns at flush time and the
+    batch is encoded straight to BSON (see encode_bson_documents).
+    With UNACKNOWLEDGED_WRITES the batches are sent with w=0, so stored counts
+    edges sent rather than edges confirmed by the server.
+    
+    Encoded batches are inserted by a writer thread (pymongo releases the GIL
+    while waiting on the socket), so pairing continues during the round-trip.
+    The queue holds at most WRITE_QUEUE_SIZE batches, blocking the producer when
+    the server falls behind. Call close() to insert the rest and stop the thread.
+    """
+    
+    WRITE_QUEUE_SIZE = 4
+    
+    def __init__(self, collection, capacity=EDGE_BATCH_SIZE):
+        if UNACKNOWLEDGED_WRITES:
+            collection = collection.with_options(write_concern=WriteConcern(w=0))
+        self.collection = collection
+        self.capacity = capacity
+        self.size = 0
+        self.stored = 0  # Updated by the writer thread; final after close()
+        self.queue = Queue(maxsize=self.WRITE_QUEUE_SIZE)
+        self.writer = Thread(target=self._write_batches, daemon=True)
+        self.writer.start()
+        self.flight1_ids = np.empty(capacity, dtype=np.int64)
+        self.flight2_ids = np.empty(capacity, dtype=np.int64)
+        self.timestamps1 = np.empty(capacity, dtype=object)
+        self.timestamps2 = np.empty(capacity, dtype=object)
+        self.time_diffs = np.empty(capacity, dtype=np.float64)
+        self.distances = np.empty(capacity, dtype=np.float64)
+        self.scores = np.empty(capacity, dtype=np.float64)
+        self.node1_ids = np.empty(capacity, dtype=object)
+        self.node2_ids = np.empty(capacity, dtype=object)
+    
+    def append(self, flight1, flight2, timestamp1, timestamp2, time_diff, distance_km, score,
+               node1_id=None, node2_id=None):
+        """Add one edge, inserting the batch when the buffer is full."""
+        i = self.size
+        self.flight1_ids[i] = flight1
+        self.flight2_ids[i] = flight2
+        self.timestamps1[i] = timestamp1
+        self.timestamps2[i] = timestamp2
+        self.time_diffs[i] = time_diff
+        self.distances[i] = distance_km
+        self.scores[i] = score
+        self.node1_ids[i] = node1_id  # ObjectIds are stored as-is (no str() hex encoding)
+        self.node2_ids[i] = node2_id
+        self.size += 1
+        
+        if self.size >= self.capacity:
+            self.flush()
+    
+    def _write_batches(self):
+        """Writer thread: insert queued batches until the None sentinel."""
+        while True:
+            docs = self.queue.get()
+            if docs is None:
+                return
+            try:
+                self.collection.insert_many(docs, ordered=False)
+                self.stored += len(docs)
+            except Exception as e:
+                print(f"\nWarning: Error inserting batch: {e}")
+    
+    def flush(self):
+        """Queue all buffered edges for insertion and reset the buffer."""
+        n = self.size
+        if n == 0:
+            return
+        
+        node_ids = (self.node1_ids[:n].tolist(), self.node2_ids[:n].tolist())
+        if not STORE_NODE_IDS or all(isinstance(oid, ObjectId) for ids in node_ids for oid in ids):
+            columns = [
+                bson_int_column(self.flight1_ids[:n]),
+                bson_int_column(self.flight2_ids[:n]),
+                bson_datetime_column(self.timestamps1[:n].tolist()),
+                bson_datetime_column(self.timestamps2[:n].tolist()),
+                (BSON_DOUBLE, self.time_diffs[:n].astype('<f8')),
+                (BSON_INT32, fixed_point(self.distances[:n], DISTANCE_SCALE)),
+                (BSON_INT32, fixed_point(self.scores[:n], SCORE_SCALE)),
+            ]
+            if STORE_NODE_IDS:
+                columns += [(BSON_OBJECTID, np.frombuffer(b''.join(oid.binary for oid in ids), dtype='V12'))
+                            for ids in node_ids]
+            docs = encode_bson_documents(EDGE_FIELDS, columns)
+        else:
+            # Missing node ids (null values) do not fit the fixed layout: build dicts
+            columns = (
+                self.flight1_ids[:n].tolist(),
+                self.flight2_ids[:n].tolist(),
+                self.timestamps1[:n].tolist(),
+                self.timestamps2[:n].tolist(),
+                self.time_diffs[:n].tolist(),
+                fixed_point(self.distances[:n], DISTANCE_SCALE).tolist(),
+                fixed_point(self.scores[:n], SCORE_SCALE).tolist(),
+                *node_ids,
+            )
+            docs = [dict(zip(EDGE_FIELDS, row)) for row in zip(*columns)]
+        self.node1_ids[:n] = None  # Release references held by the buffer
+        self.node2_ids[:n] = None
+        
+        self.queue.put(docs)
+        self.size = 0
+    
+    def close(self):
+        """Insert the remaining edges and wait for the writer thread to finish."""
+        self.flush()
+        self.queue.put(None)
+        self.writer.join()
+
+def window_candidates(window, indices, distances, time_diffs, scores):
+    """
+    Yield (distance_km, time_diff, base_score, flight_id, timestamp, node_id, get_heading)
+    for window nodes selected by the pair search (buffer indices + per-pair arrays).
+    """
+    for i, distance_km, time_diff, base_score in zip(
+            indices.tolist(), distances.tolist(), time_diffs.tolist(), scores.tolist()):
+        yield (distance_km, time_diff, base_score, int(window.flight_ids[i]),
+               window.timestamps[i], window.node_ids[i], lambda i=i: window.heading(i))
+
+if HAS_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def pair_window(node_lat, node_lon, node_time, node_flight,
+                    lat_sorted, order, lat, lon, cos_lat, times, flights,
+                    max_km, max_sec, min_score, heading_on, k,
+                    out_idx, out_dist, out_tdiff, out_score, out_count):
+        """
+        Score a block of nodes against every window node and keep, per node, the
+        k best-scoring pairs (later flight, within MAX_DISTANCE_KM and
+        MAX_TIME_DIFF_MINUTES, score bound >= min_score) in slots [i*k, i*k + k).
+        
+        Window nodes are visited in latitude order (lat_sorted/order), so each node
+        only scans its latitude band, and a longitude box and the equirectangular
+        prefilter reject most of the band before any trig is evaluated.
+        """
+        rad = math.pi / 180
+        lat_reach = max_km / 110.574
+        inv_max_km = 1.0 / max_km
+        inv_max_sec = 1.0 / max_sec
+        approx_limit = max_km * PREFILTER_SLACK / KM_PER_DEGREE
+        approx_limit2 = approx_limit * approx_limit
+        for i in prange(len(node_lat)):
+            lat_i = node_lat[i]
+            lon_i = node_lon[i]
+            cos_i = math.cos(lat_i * rad)
+            cos_far = math.cos(min(89.9, abs(lat_i) + lat_reach) * rad)
+            lon_reach = max_km / (111.32 * max(cos_far, 1e-6))
+            prefilter = abs(lat_i) + lat_reach < PREFILTER_MAX_LAT
+            
+            lo = np.searchsorted(lat_sorted, lat_i - lat_reach)
+            hi = np.searchsorted(lat_sorted, lat_i + lat_reach, side='right')
+            base = i * k
+            count = 0
+            for s in range(lo, hi):
+                j = order[s]
+                if flights[j] <= node_flight[i]:
+                    continue
+                tdiff = times[j] - node_time[i]
+                if abs(tdiff) > max_sec:
+                    continue
+                dlon = abs(lon[j] - lon_i)
+                if dlon > 180:
+                    dlon = 360 - dlon
+                if dlon > lon_reach:
+                    continue
+                
+                # Equirectangular prefilter (see equirectangular_within)
+                if prefilter:
+                    dlat = lat[j] - lat_i
+                    dx = dlon * min(cos_i, cos_lat[j])
+                    if dlat * dlat + dx * dx > approx_limit2:
+                        continue
+                
+                sin_dphi = math.sin((lat[j] - lat_i) * rad / 2)
+                sin_dlam = math.sin(dlon * rad / 2)
+                a = sin_dphi * sin_dphi + cos_i * cos_lat[j] * sin_dlam * sin_dlam
+                distance = 2 * 6371 * math.asin(math.sqrt(min(1.0, a)))
+                if distance > max_km:
+                    continue
+                
+                score = (0.5 * max(0.0, 1 - distance * inv_max_km) +
+                         0.5 * max(0.0, 1 - abs(tdiff) * inv_max_sec))
+                bound = 0.8 * score + 0.2 if heading_on else score
+                if bound < min_score:
+                    continue
+                
+                # Keep the k best scores: fill free slots, then replace the worst
+                slot = base + count
+                if count < k:
+                    count += 1
+                else:
+                    slot = base
+                    for m in range(base + 1, base + k):
+                        if out_score[m] < out_score[slot]:
+                            slot = m
+                    if out_score[slot] >= score:
+                        continue
+                out_idx[slot] = j
+                out_dist[slot] = distance
+                out_tdiff[slot] = tdiff
+                out_score[slot] = score
+            out_count[i] = count
+
+def sampled_nodes(nodes_cursor):
+    """
+    Yield every NODE_SAMPLING_RATE-th node of a cursor.
+    """
+    node_index = 0
+    for node in nodes_cursor:
+        node_index += 1
+        
+        # Skip nodes based on sampling rate
+        if NODE_SAMPLING_RATE > 1 and node_index % NODE_SAMPLING_RATE != 0:
+            continue  # Skip this node
+        
+        yield node
+
+def node_trig(node):
+    """
+    Trig terms of a node (phi, cos(phi), lambda), shared by every candidate comparison.
+    """
+    node_phi = math.radians(node['lat'])
+    return node_phi, math.cos(node_phi), math.radians(node['lon'])
+
+def window_node_candidates(window, nodes):
+    """
+    Yield (node, node_timestamp, candidates) using the grid-indexed window and a
+    vectorized NumPy pass per node.
+    """
+    time_delta = timedelta(minutes=MAX_TIME_DIFF_MINUTES)
+    for node in nodes:
+        node_timestamp = to_datetime(node['timestamp'])
+        
+        # Slide the window to [node_timestamp - delta, node_timestamp + delta]
+        window.advance_to(node_timestamp + time_delta)
+        window.evict_before(node_timestamp - time_delta)
+        
+        # Find nearby nodes of later flights in the window
+        nearby = window.nearest(
+            node['lat'], node['lon'], node_trig(node)[1], epoch_seconds(node_timestamp),
+            node['flight_id'], MAX_CANDIDATES_PER_NODE
+        )
+        yield node, node_timestamp, window_candidates(window, *nearby)
+
+def node_blocks(nodes):
+    """
+    Group a node stream into lists of NODE_BLOCK_SIZE nodes.
+    """
+    block = []
+    for node in nodes:
+        block.append(node)
+        if len(block) == NODE_BLOCK_SIZE:
+            yield block
+            block = []
+    if block:
+        yield block
+
+def slide_to_block(window, block, time_delta):
+    """
+    Slide the window to cover every node of a time-sorted block and return the
+    block's timestamps; the exact per-pair time limit is applied when scoring.
+    """
+    timestamps = [to_datetime(node['timestamp']) for node in block]
+    window.advance_to(timestamps[-1] + time_delta)
+    window.evict_before(timestamps[0] - time_delta)
+    return timestamps
+
+def block_node_candidates(window, nodes):
+    """
+    Yield (node, node_timestamp, candidates) scoring NODE_BLOCK_SIZE nodes at a time
+    against the window with the compiled pair_window kernel.
+    """
+    time_delta = timedelta(minutes=MAX_TIME_DIFF_MINUTES)
+    k = MAX_CANDIDATES_PER_NODE
+    
+    # Output slots are preallocated once and reused for every block
+    out_idx = np.empty(NODE_BLOCK_SIZE * k, dtype=np.int64)
+    out_dist = np.empty(NODE_BLOCK_SIZE * k, dtype=np.float64)
+    out_tdiff = np.empty(NODE_BLOCK_SIZE * k, dtype=np.float64)
+    out_score = np.empty(NODE_BLOCK_SIZE * k, dtype=np.float64)
+    out_count = np.empty(NODE_BLOCK_SIZE, dtype=np.int64)
+    
+    for block in node_blocks(nodes):
+        yield from score_block(window, block, time_delta, k,
+                               out_idx, out_dist, out_tdiff, out_score, out_count)
+
+def unit_vectors(lats, lons):
+    """
+    Points on the unit sphere (x, y, z) for arrays of lat/lon in degrees.
+    """
+    phi = np.radians(np.asarray(lats, dtype=np.float64))
+    lam = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_phi = np.cos(phi)
+    return np.column_stack((cos_phi * np.cos(lam), cos_phi * np.sin(lam), np.sin(phi)))
+
+def kdtree_node_candidates(window, nodes):
+    """
+    Yield (node, node_timestamp, candidates) using a k-d tree over the window.
+    
+    Points are 3D unit vectors, where a great-circle radius is an exact chord
+    radius at every latitude (no widened longitude reach near the poles, no seam
+    at ±180°). The tree is rebuilt once per block of nodes and queried for the
+    whole block in one call.
+    """
+    time_delta = timedelta(minutes=MAX_TIME_DIFF_MINUTES)
+    # Chord of MAX_DISTANCE_KM on the unit sphere, with slack for the float32 distance pass
+    chord = 2 * math.sin(MAX_DISTANCE_KM / (2 * 6371)) * (1 + 1e-4)
+    
+    for block in node_blocks(nodes):
+        timestamps = slide_to_block(window, block, time_delta)
+        start, end = window.start, window.end
+        tree = cKDTree(unit_vectors(window.lat[start:end], window.lon[start:end]))
+        neighbours = tree.query_ball_point(
+            unit_vectors([node['lat'] for node in block], [node['lon'] for node in block]),
+            r=chord, return_sorted=False
+        )
+        
+        for node, node_timestamp, near in zip(block, timestamps, neighbours):
+            nearby = window.select(
+                np.asarray(near, dtype=np.int64) + start, node['lat'], node['lon'],
+                node_trig(node)[1], epoch_seconds(node_timestamp),
+                node['flight_id'], MAX_CANDIDATES_PER_NODE
+            )
+            yield node, node_timestamp, window_candidates(window, *nearby)
+
+def score_block(window, block, time_delta, k, out_idx, out_dist, out_tdiff, out_score, out_count):
+    """
+    Run pair_window for one block of time-sorted nodes and yield per-node results.
+    """
+    timestamps = slide_to_block(window, block, time_delta)
+    
+    start, end = window.start, window.end
+    lats = window.lat[start:end]
+    order = np.argsort(lats, kind='stable')
+    pair_window(
+        np.array([node['lat'] for node in block], dtype=np.float64),
+        np.array([node['lon'] for node in block], dtype=np.float64),
+        np.array([epoch_seconds(ts) for ts in timestamps], dtype=np.float64),
+        np.array([node['flight_id'] for node in block], dtype=np.int64),
+        lats[order], order, lats, window.lon[start:end], window.cos_lat[start:end],
+        window.times[start:end], window.flight_ids[start:end],
+        float(MAX_DISTANCE_KM), float(MAX_TIME_DIFF_MINUTES * 60), MIN_SCORE_TO_STORE,
+        COMPUTE_HEADING, k, out_idx, out_dist, out_tdiff, out_score, out_count
+    )
+    
+    for b, node in enumerate(block):
+        slots = slice(b * k, b * k + out_count[b])
+        yield node, timestamps[b], window_candidates(
+            window, out_idx[slots] + start, out_dist[slots], out_tdiff[slots], out_score[slots]
+        )
+
+def geo_node_candidates(collection, nodes, known_headings=None):
+    """
+    Yield (node, node_timestamp, candidates) using a server-side query per node.
+    """
+    for node in nodes:
+        node_timestamp = to_datetime(node['timestamp'])
+        yield node, node_timestamp, query_candidates(
+            collection, node['lat'], node['lon'], node_trig(node),
+            node['flight_id'], node_timestamp, known_headings
+        )
+
+def query_candidates(collection, node_lat, node_lon, node_trig, node_flight_id, node_timestamp,
+                     known_headings=None):
+    """
+    Yield (distance_km, time_diff, base_score, flight_id, timestamp, node_id, get_heading)
+    for nearby nodes of later flights, found with a server-side geospatial query.
+    
+    $geoWithin/$centerSphere returns an unordered set, which skips the distance
+    sort $near performs; we only need the nodes inside the radius. Only later
+    flights are requested (flight_id $gt), since each pair is stored once by the
+    node with the smaller flight_id.
+    node_trig is the node's precomputed (phi, cos(phi), lambda); known_headings
+    are passed on to calculate_node_heading.
+    """
+    node_phi, node_cos_phi, node_lam = node_trig
+    time_delta = timedelta(minutes=MAX_TIME_DIFF_MINUTES)
+    nearby_nodes = collection.find({
+        'location': {
+            '$geoWithin': {
+                '$centerSphere': [[node_lon, node_lat], MAX_DISTANCE_KM / 6378.1]  # Radius in radians
+            }
+        },
+        'flight_id': {'$gt': node_flight_id},  # Later flights only (excludes the same flight)
+        'timestamp': {
+            '$gte': node_timestamp - time_delta,
+            '$lte': node_timestamp + time_delta
+        }
+    }, NODE_FIELDS, batch_size=MAX_CANDIDATES_PER_NODE).limit(MAX_CANDIDATES_PER_NODE)
+    
+    for candidate in nearby_nodes:
+        distance_km = haversine_distance_precomp(
+            node_phi, node_cos_phi, node_lam, candidate['lat'], candidate['lon']
+        )
+        candidate_timestamp = to_datetime(candidate['timestamp'])
+        time_diff = (candidate_timestamp - node_timestamp).total_seconds()
+        yield (distance_km, time_diff, compute_feasibility_score(distance_km, time_diff),
+               candidate['flight_id'], candidate_timestamp, candidate.get('_id'),
+               lambda candidate=candidate: calculate_node_heading(collection, candidate, known_headings))
 
 # Generate formation edges
 print(f"\nGenerating candidate formation edges...")
@@ -247,6 +1200,28 @@ if existing_edges > 0:
         edges_collection.delete_many({})
         print("✓ Collection cleared")
 
+# One-time migration: store string timestamps as BSON datetimes, so the cursors
+# decode them natively and range queries compare dates instead of strings
+try:
+    if nodes_collection.find_one({'timestamp': {'$type': 'string'}}, {'_id': 1}):
+        print("\nConverting string timestamps to BSON dates...")
+        result = nodes_collection.update_many(
+            {'timestamp': {'$type': 'string'}},
+            [{'$set': {'timestamp': {'$toDate': '$timestamp'}}}]
+        )
+        print(f"✓ Converted {result.modified_count:,} node timestamps")
+except Exception as e:
+    print(f"\n⚠ Warning: Could not convert string timestamps: {e}")
+
+# Make sure the node indexes the search relies on exist before the run
+# (create_index is a no-op when the index is already there)
+print("\nEnsuring node indexes...")
+nodes_collection.create_index(TIME_ORDER)  # Time-sorted cursors
+if CANDIDATE_SEARCH == 'geo':
+    # flight_id is in the key so the later-flight filter is checked during the index scan
+    nodes_collection.create_index([('location', '2dsphere'), ('timestamp', 1), ('flight_id', 1)])
+print("✓ Node indexes ready")
+
 # Get all unique timestamps to process in time windows
 print("\nAnalyzing time distribution...")
 pipeline = [
@@ -261,192 +1236,201 @@ else:
     print("  Could not determine time range")
     sys.exit(1)
 
-# Process nodes in time windows to optimize queries
-# Group nodes into time windows of MAX_TIME_DIFF_MINUTES
-time_window_minutes = MAX_TIME_DIFF_MINUTES * 2  # Overlapping windows
-time_step = timedelta(minutes=MAX_TIME_DIFF_MINUTES)
-
-edges_generated = 0
-edges_stored = 0
-batch_edges = []
-batch_size = 10000  # Larger batch size for better performance (fewer MongoDB operations)
-processed_nodes = 0
-
-# Performance configuration
-# Note: Threading/multiprocessing with MongoDB cursors is complex
-# Current optimizations: connection pooling, larger batches, reduced overhead
-
-start_time = time.time()
-
-# Strategy: Iterate through nodes and for each, find nearby nodes using geospatial query
-print("\nProcessing nodes to find formation candidates...")
-
-# Get cursor for all nodes (or limited subset for testing)
-if MAX_NODES_TO_PROCESS:
-    nodes_cursor = nodes_collection.find().sort([('timestamp', 1), ('flight_id', 1)]).limit(MAX_NODES_TO_PROCESS)
-    total_nodes_in_db = min(MAX_NODES_TO_PROCESS, nodes_collection.count_documents({}))
-else:
-    nodes_cursor = nodes_collection.find().sort([('timestamp', 1), ('flight_id', 1)])
-    total_nodes_in_db = nodes_collection.count_documents({})
-
-# Calculate expected nodes to process with sampling
-if NODE_SAMPLING_RATE > 1:
-    expected_nodes_to_process = total_nodes_in_db // NODE_SAMPLING_RATE
-else:
-    expected_nodes_to_process = total_nodes_in_db
-total_nodes = expected_nodes_to_process  # For progress tracking
+def time_slabs(min_time, max_time, num_slabs):
+    """
+    Split [min_time, max_time] into num_slabs contiguous [start, end) ranges.
+    """
+    step = (max_time - min_time) / num_slabs
+    bounds = [min_time + step * i for i in range(num_slabs)]
+    bounds.append(max_time + timedelta(seconds=1))  # Make the last slab include max_time
+    return [(i, bounds[i], bounds[i + 1]) for i in range(num_slabs)]
 
-if HAS_TQDM:
-    nodes_cursor = tqdm(nodes_cursor, total=total_nodes_in_db, desc="Processing nodes")
+def fetch_bin(collection, bin_start, bin_end):
+    """
+    Nodes with timestamps in [bin_start, bin_end), in TIME_ORDER.
+    """
+    return list(collection.find({'timestamp': {'$gte': bin_start, '$lt': bin_end}}, NODE_FIELDS)
+                .sort(TIME_ORDER).hint(TIME_ORDER).batch_size(10000))
 
-current_time_window = None
-window_nodes = []  # Cache nodes in current time window
+def binned_nodes(collection, start, end):
+    """
+    Yield the nodes with timestamps in [start, end) in TIME_ORDER, one
+    BIN_MINUTES index range query at a time.
+    
+    Each query is hinted to the (timestamp, flight_id) index, so the server never
+    sorts in memory, and the first nodes arrive after one bin instead of the whole
+    range. A background thread fetches the next bin while the current one is
+    being processed, overlapping network time with the pairing work.
+    """
+    step = timedelta(minutes=BIN_MINUTES)
+    with ThreadPoolExecutor(max_workers=1) as prefetch:
+        bin_end = min(start + step, end)
+        pending = prefetch.submit(fetch_bin, collection, start, bin_end)
+        while pending is not None:
+            nodes = pending.result()
+            bin_start, bin_end = bin_end, min(bin_end + step, end)
+            pending = prefetch.submit(fetch_bin, collection, bin_start, bin_end) if bin_start < end else None
+            yield from nodes
 
-node_index = 0
-for node in nodes_cursor:
-    node_index += 1
+def process_slab(slab):
+    """
+    Generate and store edges for the nodes whose timestamp falls in one time slab.
     
-    # Skip nodes based on sampling rate
-    if NODE_SAMPLING_RATE > 1 and node_index % NODE_SAMPLING_RATE != 0:
-        continue  # Skip this node
+    The slab's nodes are the outer loop; the candidate window is fed from the slab
+    plus a halo of MAX_TIME_DIFF_MINUTES on both sides, so pairs that straddle a slab
+    boundary are still found, and each edge is produced by exactly one slab.
+    Runs in a worker process with its own MongoClient and its own edge writes.
+    Returns (processed_nodes, edges_generated, edges_stored).
+    """
+    slab_index, slab_start, slab_end = slab
     
-    processed_nodes += 1
+    worker_client = open_client()
+    worker_db = worker_client[DB_NAME]
+    slab_nodes = worker_db[NODES_COLLECTION]
+    slab_edges = worker_db[EDGES_COLLECTION]
     
-    # Extract node data
-    node_id = node.get('_id')
-    node_lat = node['lat']
-    node_lon = node['lon']
-    node_timestamp = node['timestamp']
-    node_flight_id = node['flight_id']
+    edges_generated = 0
+    edge_buffer = EdgeBuffer(slab_edges)  # Larger batches mean fewer MongoDB operations
+    processed_nodes = 0
     
-    # Convert timestamp if it's a string
-    if isinstance(node_timestamp, str):
-        node_timestamp = datetime.fromisoformat(node_timestamp.replace('Z', '+00:00'))
+    slab_start_time = time.time()
     
-    # Calculate heading for this node if enabled
-    node_heading = None
-    if COMPUTE_HEADING:
-        node_heading = calculate_node_heading(nodes_collection, node)
+    # Stream the slab's nodes (or limited subset for testing)
+    slab_query = {'timestamp': {'$gte': slab_start, '$lt': slab_end}}
+    nodes_cursor = binned_nodes(slab_nodes, slab_start, slab_end)
+    total_nodes_in_slab = slab_nodes.count_documents(slab_query)
+    if MAX_NODES_TO_PROCESS:
+        nodes_cursor = islice(nodes_cursor, MAX_NODES_TO_PROCESS)
+        total_nodes_in_slab = min(MAX_NODES_TO_PROCESS, total_nodes_in_slab)
     
-    # Use geospatial query to find nearby nodes
-    # Query for nodes within MAX_DISTANCE_KM (convert to meters for $near)
-    max_distance_m = MAX_DISTANCE_KM * 1000
+    # Calculate expected nodes to process with sampling
+    if NODE_SAMPLING_RATE > 1:
+        total_nodes = total_nodes_in_slab // NODE_SAMPLING_RATE
+    else:
+        total_nodes = total_nodes_in_slab  # For progress tracking
     
-    # Time window for filtering
-    time_window_start = node_timestamp - timedelta(minutes=MAX_TIME_DIFF_MINUTES)
-    time_window_end = node_timestamp + timedelta(minutes=MAX_TIME_DIFF_MINUTES)
+    if HAS_TQDM:
+        nodes_cursor = tqdm(nodes_cursor, total=total_nodes_in_slab,
+                            desc=f"Slab {slab_index + 1} nodes", position=slab_index % num_workers)
     
-    # Optimized query: Use hint for index, batch_size for faster iteration
-    nearby_nodes = nodes_collection.find({
-        'location': {
-            '$near': {
-                '$geometry': {
-                    'type': 'Point',
-                    'coordinates': [node_lon, node_lat]
-                },
-                '$maxDistance': max_distance_m
-            }
-        },
-        'flight_id': {'$ne': node_flight_id},  # Exclude same flight
-        'timestamp': {
-            '$gte': time_window_start,
-            '$lte': time_window_end
-        }
-    }, batch_size=MAX_CANDIDATES_PER_NODE).limit(MAX_CANDIDATES_PER_NODE)  # Limit candidates + batch size
+    # Sliding time window of candidate nodes
+    # Both cursors walk the same (timestamp, flight_id) order: the window's source cursor
+    # pushes nodes onto the right until it is MAX_TIME_DIFF_MINUTES ahead of the current
+    # node, and nodes more than MAX_TIME_DIFF_MINUTES behind are popped from the left.
+    # Each node enters and leaves the window once instead of costing a Mongo query per node.
+    time_delta = timedelta(minutes=MAX_TIME_DIFF_MINUTES)
     
-        # Process each nearby node
-    for candidate in nearby_nodes:
-        candidate_id = candidate.get('_id')
-        candidate_lat = candidate['lat']
-        candidate_lon = candidate['lon']
-        candidate_timestamp = candidate['timestamp']
-        candidate_flight_id = candidate['flight_id']
-        
-        # Skip if we've already processed this pair (avoid duplicates)
-        # Only process when node_flight_id < candidate_flight_id to process each pair once
-        if node_flight_id >= candidate_flight_id:
-            # If flight IDs are equal (shouldn't happen due to filter), skip
-            if node_flight_id == candidate_flight_id:
-                continue
-            # If candidate's flight_id is smaller, skip (it will process us when it's the node)
-            continue
-        
-        # Convert timestamp if needed
-        if isinstance(candidate_timestamp, str):
-            candidate_timestamp = datetime.fromisoformat(candidate_timestamp.replace('Z', '+00:00'))
-        
-        # Calculate distance and time difference (MongoDB already filtered, but we need values)
-        distance_km = haversine_distance(node_lat, node_lon, candidate_lat, candidate_lon)
-        time_diff = (candidate_timestamp - node_timestamp).total_seconds()
-        
-        # Skip redundant validation - MongoDB query already filtered by distance and time
-        # Trust the query results for maximum speed
-        
-        # Calculate heading for candidate if enabled
-        candidate_heading = None
-        heading_sim = None
-        if COMPUTE_HEADING:
-            candidate_heading = calculate_node_heading(nodes_collection, candidate)
-            if node_heading is not None and candidate_heading is not None:
-                heading_sim = heading_similarity(node_heading, candidate_heading)
-        
-        # Compute feasibility score
-        feasibility_score = compute_feasibility_score(
-            node, candidate, distance_km, time_diff, heading_sim
-        )
-        
-        # Create edge (we already ensure node_flight_id < candidate_flight_id above)
-        flight1 = node_flight_id
-        flight2 = candidate_flight_id
+    # Headings by node _id, shared by every lookup in the slab: the slab and its halo
+    # are filled from one aggregation (only when scoring headings), the rest on first use
+    known_headings = {}
+    if COMPUTE_HEADING:
+        known_headings = precompute_headings(slab_nodes, slab_start - time_delta, slab_end + time_delta)
+    
+    nodes = sampled_nodes(nodes_cursor)
+    if CANDIDATE_SEARCH == 'geo':
+        node_stream = geo_node_candidates(slab_nodes, nodes, known_headings)
+    else:
+        # The halo end is inclusive (pairs exactly MAX_TIME_DIFF_MINUTES apart count);
+        # BSON dates have millisecond precision
+        advance_cursor = binned_nodes(slab_nodes, slab_start - time_delta,
+                                      slab_end + time_delta + timedelta(milliseconds=1))
+        window = CandidateWindow(slab_nodes, advance_cursor, known_headings)
+        if CANDIDATE_SEARCH == 'kdtree':
+            node_stream = kdtree_node_candidates(window, nodes)
+        elif HAS_NUMBA:
+            # Share the cores between the slab workers' kernel threads
+            numba.set_num_threads(max(1, numba.config.NUMBA_NUM_THREADS // num_workers))
+            node_stream = block_node_candidates(window, nodes)
+        else:
+            node_stream = window_node_candidates(window, nodes)
+    
+    for node, node_timestamp, candidates in node_stream:
+        processed_nodes += 1
         
-        # Create edge document (simplified for speed - minimal fields for heatmap)
-        edge = {
-            'flight1_id': flight1,
-            'flight2_id': flight2,
-            'timestamp1': node_timestamp,
-            'timestamp2': candidate_timestamp,
-            'time_diff_seconds': time_diff,
-            'distance_km': round(distance_km, 2),  # Round to 2 decimals for storage efficiency
-            'feasibility_score': round(feasibility_score, 4),  # Round to 4 decimals
-            # Optional fields (commented out for speed - uncomment if needed)
-            # 'node1_id': str(node_id),
-            # 'node2_id': str(candidate_id),
-            # 'heading1': node_heading,
-            # 'heading2': candidate_heading,
-            # 'heading_similarity': heading_sim,
-            # 'created_at': datetime.now()
-        }
+        # Extract node data
+        node_id = node.get('_id')
+        node_flight_id = node['flight_id']
         
-        edges_generated += 1
+        # Heading for this node is computed on first use (only if a candidate needs it)
+        node_heading = None
+        node_heading_known = False
         
-        # Store edge in batch
-        batch_edges.append(edge)
+        # Process each nearby node
+        # Every candidate search returns later flights only (flight_id greater than the
+        # node's), so each pair is processed once, by the node with the smaller flight_id
+        for (distance_km, time_diff, base_score, candidate_flight_id,
+             candidate_timestamp, candidate_id, get_candidate_heading) in candidates:
+            # Upper-bound pruning: skip heading lookups and storage for candidates that
+            # cannot reach MIN_SCORE_TO_STORE even with a perfect heading match
+            if feasibility_upper_bound(base_score) < MIN_SCORE_TO_STORE:
+                continue
+            
+            # Calculate headings if enabled
+            candidate_heading = None
+            heading_sim = None
+            if COMPUTE_HEADING:
+                if not node_heading_known:
+                    node_heading = calculate_node_heading(slab_nodes, node, known_headings)
+                    node_heading_known = True
+                candidate_heading = get_candidate_heading()
+                if node_heading is not None and candidate_heading is not None:
+                    heading_sim = heading_similarity(node_heading, candidate_heading)
+            
+            # Feasibility score: the distance/time score unless a heading term applies
+            feasibility_score = base_score
+            if heading_sim is not None:
+                feasibility_score = compute_feasibility_score(distance_km, time_diff, heading_sim)
+            
+            # Store edge (the candidate search ensures node_flight_id < candidate_flight_id)
+            edge_buffer.append(
+                node_flight_id, candidate_flight_id, node_timestamp, candidate_timestamp,
+                time_diff, distance_km, feasibility_score, node_id, candidate_id
+            )
+            edges_generated += 1
         
-        # Insert batch when full
-        if len(batch_edges) >= batch_size:
-            try:
-                edges_collection.insert_many(batch_edges, ordered=False)
-                edges_stored += len(batch_edges)
-                batch_edges = []
-            except Exception as e:
-                print(f"\nWarning: Error inserting batch: {e}")
-                batch_edges = []
-    
-    # Progress update (less frequent for better performance)
-    if processed_nodes % 10000 == 0:
-        elapsed = time.time() - start_time
-        rate = processed_nodes / elapsed if elapsed > 0 else 0
-        remaining = (total_nodes - processed_nodes) / rate if rate > 0 else 0
-        print(f"  Processed {processed_nodes:,}/{total_nodes:,} nodes "
-              f"({edges_generated:,} edges found, ~{remaining/60:.1f} min remaining)")
-
-# Insert remaining edges
-if batch_edges:
-    try:
-        edges_collection.insert_many(batch_edges, ordered=False)
-        edges_stored += len(batch_edges)
-    except Exception as e:
-        print(f"\nWarning: Error inserting final batch: {e}")
+        # Progress update (less frequent for better performance)
+        if processed_nodes % 10000 == 0:
+            elapsed = time.time() - slab_start_time
+            rate = processed_nodes / elapsed if elapsed > 0 else 0
+            remaining = (total_nodes - processed_nodes) / rate if rate > 0 else 0
+            print(f"  Slab {slab_index + 1}: processed {processed_nodes:,}/{total_nodes:,} nodes "
+                  f"({edges_generated:,} edges found, ~{remaining/60:.1f} min remaining)")
+    
+    # Insert remaining edges and wait for queued batches
+    edge_buffer.close()
+    
+    worker_client.close()
+    return processed_nodes, edges_generated, edge_buffer.stored
+
+# Strategy: Split the time range into slabs, and in each slab iterate through
+# time-sorted nodes and find nearby nodes in a sliding time window
+print("\nProcessing nodes to find formation candidates...")
+
+# Test mode limits the node count, which only makes sense for a single slab
+min_time, max_time = to_datetime(min_time), to_datetime(max_time)
+if MAX_NODES_TO_PROCESS:
+    num_slabs = 1
+else:
+    num_slabs = max(1, NUM_WORKERS,
+                    math.ceil((max_time - min_time) / timedelta(minutes=SLAB_MINUTES)))
+num_workers = min(max(1, NUM_WORKERS), num_slabs)
+slabs = time_slabs(min_time, max_time, num_slabs)
+print(f"  {num_slabs} time slabs across {num_workers} worker process(es)")
+
+start_time = time.time()
+
+# Workers are forked so they inherit this module's configuration and functions
+# without re-running the script (not available on Windows: run slabs in-process)
+if num_workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+    with ProcessPoolExecutor(max_workers=num_workers,
+                             mp_context=multiprocessing.get_context('fork')) as executor:
+        slab_results = list(executor.map(process_slab, slabs))
+else:
+    slab_results = [process_slab(slab) for slab in slabs]
+
+processed_nodes = sum(result[0] for result in slab_results)
+edges_generated = sum(result[1] for result in slab_results)
+edges_stored = sum(result[2] for result in slab_results)
 
 elapsed_time = time.time() - start_time
 
@@ -463,36 +1447,22 @@ print("Creating indexes on edges collection...")
 print("="*60)
 
 try:
-    # Index on flight pairs for fast lookups
-    print("\nCreating index on flight1_id + flight2_id...")
-    edges_collection.create_index([('flight1_id', 1), ('flight2_id', 1)])
-    print("✓ Index created")
-    
-    # Unique index to prevent duplicate edges (same flight pair, similar timestamps)
-    # We allow some tolerance for timestamp differences
-    print("\nCreating compound index on flight pairs + timestamps...")
-    edges_collection.create_index([
-        ('flight1_id', 1),
-        ('flight2_id', 1),
-        ('timestamp1', 1),
-        ('timestamp2', 1)
-    ], name='flight_pair_timestamps')
-    print("✓ Index created")
-    
-    # Index on feasibility score for filtering
-    print("\nCreating index on feasibility_score...")
-    edges_collection.create_index([('feasibility_score', -1)])  # Descending for top scores
-    print("✓ Index created")
-    
-    # Index on distance for filtering
-    print("\nCreating index on distance_km...")
-    edges_collection.create_index([('distance_km', 1)])
-    print("✓ Index created")
-    
-    # Index on timestamps
-    print("\nCreating index on timestamp1 + timestamp2...")
-    edges_collection.create_index([('timestamp1', 1), ('timestamp2', 1)])
-    print("✓ Index created")
+    # All edge indexes are built by one createIndexes command after the bulk load,
+    # so the server builds them together instead of scanning the collection per index
+    print("\nCreating indexes on flight1_id + flight2_id, feasibility_score_i, distance_km_i, timestamp1 + timestamp2...")
+    edges_collection.create_indexes([
+        IndexModel([('flight1_id', 1), ('flight2_id', 1)]),  # Flight pair lookups
+        IndexModel([('feasibility_score_i', -1)]),  # Descending for top scores
+        IndexModel([('distance_km_i', 1)]),  # Distance filtering
+        IndexModel([('timestamp1', 1), ('timestamp2', 1)]),
+    ])
+    print("✓ Indexes created")
+    
+    # No query uses the four-field flight pair + timestamps index; remove it if an
+    # earlier run created it
+    if 'flight_pair_timestamps' in edges_collection.index_information():
+        edges_collection.drop_index('flight_pair_timestamps')
+        print("✓ Dropped unused index flight_pair_timestamps")
     
     print("\n✓ All indexes created successfully")
     
@@ -512,42 +1482,42 @@ try:
     pipeline = [
         {'$group': {
             '_id': None,
-            'avg_score': {'$avg': '$feasibility_score'},
-            'min_score': {'$min': '$feasibility_score'},
-            'max_score': {'$max': '$feasibility_score'}
+            'avg_score': {'$avg': '$feasibility_score_i'},
+            'min_score': {'$min': '$feasibility_score_i'},
+            'max_score': {'$max': '$feasibility_score_i'}
         }}
     ]
     stats = list(edges_collection.aggregate(pipeline))
     if stats:
         print(f"\nFeasibility Score Statistics:")
-        print(f"  Average: {stats[0]['avg_score']:.4f}")
-        print(f"  Minimum: {stats[0]['min_score']:.4f}")
-        print(f"  Maximum: {stats[0]['max_score']:.4f}")
+        print(f"  Average: {stats[0]['avg_score'] / SCORE_SCALE:.4f}")
+        print(f"  Minimum: {stats[0]['min_score'] / SCORE_SCALE:.4f}")
+        print(f"  Maximum: {stats[0]['max_score'] / SCORE_SCALE:.4f}")
     
     # Average distance
     pipeline = [
         {'$group': {
             '_id': None,
-            'avg_distance': {'$avg': '$distance_km'},
-            'min_distance': {'$min': '$distance_km'},
-            'max_distance': {'$max': '$distance_km'}
+            'avg_distance': {'$avg': '$distance_km_i'},
+            'min_distance': {'$min': '$distance_km_i'},
+            'max_distance': {'$max': '$distance_km_i'}
         }}
     ]
     stats = list(edges_collection.aggregate(pipeline))
     if stats:
         print(f"\nDistance Statistics:")
-        print(f"  Average: {stats[0]['avg_distance']:.2f} km")
-        print(f"  Minimum: {stats[0]['min_distance']:.2f} km")
-        print(f"  Maximum: {stats[0]['max_distance']:.2f} km")
+        print(f"  Average: {stats[0]['avg_distance'] / DISTANCE_SCALE:.2f} km")
+        print(f"  Minimum: {stats[0]['min_distance'] / DISTANCE_SCALE:.2f} km")
+        print(f"  Maximum: {stats[0]['max_distance'] / DISTANCE_SCALE:.2f} km")
     
     # Sample edges
     print(f"\nSample edges (top 10 by feasibility score):")
-    sample_edges = edges_collection.find().sort([('feasibility_score', -1)]).limit(10)
+    sample_edges = edges_collection.find().sort([('feasibility_score_i', -1)]).limit(10)
     for i, edge in enumerate(sample_edges, 1):
         print(f"\n  {i}. Flight {edge['flight1_id']} <-> Flight {edge['flight2_id']}")
-        print(f"     Distance: {edge['distance_km']:.2f} km")
+        print(f"     Distance: {edge['distance_km_i'] / DISTANCE_SCALE:.2f} km")
         print(f"     Time diff: {edge['time_diff_seconds']:.1f} seconds")
-        print(f"     Feasibility score: {edge['feasibility_score']:.4f}")
+        print(f"     Feasibility score: {edge['feasibility_score_i'] / SCORE_SCALE:.4f}")
         if edge.get('heading_similarity') is not None:
             print(f"     Heading similarity: {edge['heading_similarity']:.4f}")
     
@@ -559,7 +1529,7 @@ print("STEP 5 Complete!")
 print("="*60)
 print(f"\nEdges are stored in collection '{EDGES_COLLECTION}' in database '{DB_NAME}'")
 print("\nExample query to find high-quality formation candidates:")
-print("  edges_collection.find({'feasibility_score': {'$gt': 0.8}})")
+print(f"  edges_collection.find({{'feasibility_score_i': {{'$gt': {int(0.8 * SCORE_SCALE)}}}}})  # score > 0.8")
 
 client.close()
 print("\nConnection closed.")
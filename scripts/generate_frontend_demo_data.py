@@ -17,21 +17,42 @@ Optional knobs (env or CLI):
   --max-flights 5000
   --max-scenarios 100
   --max-pairs 20000
+  --workers 8
 """
 
 from __future__ import annotations
 
 import argparse
+import heapq
 import json
 import math
+import multiprocessing
 import os
+import tempfile
 from collections import defaultdict
-from datetime import datetime, timedelta
-from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache, partial
+from itertools import islice
 from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
 from pymongo import MongoClient
 
+# Try to import orjson for faster JSON output, but make it optional
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# Try to import numba to JIT-compile the formation pair scan, but make it optional
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
 # Defaults
 DEFAULT_OUT_SCENARIOS = "frontend/src/data/scenarios.json"
 DEFAULT_OUT_MATCHES = "frontend/src/data/matches.json"
@@ -46,12 +67,16 @@ DEFAULT_OUT_MATCHES = "frontend/src/data/matches.json"
 TARGET_REPLAY_POINTS = 600
 MAX_REPLAY_POINTS = 2000
 
+# Flights (each with its pushed node list) per cursor batch when fetching nodes
+FLIGHT_BATCH_SIZE = 200
+
 # Formation flight parameters
 # NOTE: these are "demo-friendly" defaults to reliably produce scenarios.
 # Tighten them if you want more realistic formation constraints.
 MAX_SEPARATION_KM_DEFAULT = 200  # km
 MIN_FORMATION_TIME_MINUTES_DEFAULT = 10
 MAX_TIME_DIFF_MINUTES_DEFAULT = 30
+CANDIDATE_OVERLAP_MINUTES = 60  # slack when pairing flights by time window
 EARTH_RADIUS_KM = 6371
 
 # Fuel/CO2 model (rough)
@@ -70,89 +95,227 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     return EARTH_RADIUS_KM * c
 
 
+def haversine_vector(lat1, lon1, lat2, lon2, cos_lat1=None, cos_lat2=None) -> np.ndarray:
+    """
+    Great-circle distance in km between array (or scalar) coordinates. Pass
+    precomputed cos(lat) values to skip recomputing them.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    if cos_lat1 is None:
+        cos_lat1 = np.cos(lat1)
+    if cos_lat2 is None:
+        cos_lat2 = np.cos(lat2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos_lat2 * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(a))
+
+
+def grid_reach(max_sep_km: float, max_abs_lat: float) -> Tuple[int, int]:
+    """
+    How many 1-degree grid cells apart (lat, lon) two points can be and still be
+    within max_sep_km, given neither is poleward of max_abs_lat. Conservative:
+    it only ever lets through pairs haversine has to decide.
+    """
+    half_angle = max_sep_km / (2 * EARTH_RADIUS_KM)
+    lat_cells = math.ceil(math.degrees(2 * half_angle))
+    cos_far = math.cos(math.radians(min(90.0, max_abs_lat + lat_cells)))
+    if half_angle >= math.pi / 2 or math.sin(half_angle) >= cos_far:
+        return lat_cells, 360
+    return lat_cells, math.ceil(math.degrees(2 * math.asin(math.sin(half_angle) / cos_far)))
+
+
+if HAS_NUMBA:
+    @njit(cache=True, fastmath=True)
+    def scan_pair(lats1, lons1, cos1, cells1, lo, hi, lats2, lons2, cos2, cells2, lat_cells, lon_cells, max_sep_km):
+        """
+        Compare each nodes1 point i against nodes2[lo[i]:hi[i]] and return the
+        (idx1, idx2, distance_km) arrays of pairs within max_sep_km. Pairs whose
+        (lat, lon) grid cells are further apart than lat_cells/lon_cells are
+        rejected with integer compares before any trig; cos(lat) comes
+        precomputed per node (cos1/cos2).
+        """
+        rad = math.pi / 180
+        total = 0
+        for i in range(len(lats1)):
+            total += hi[i] - lo[i]
+        idx1 = np.empty(total, dtype=np.int64)
+        idx2 = np.empty(total, dtype=np.int64)
+        dist = np.empty(total, dtype=np.float64)
+
+        count = 0
+        for i in range(len(lats1)):
+            for j in range(lo[i], hi[i]):
+                if abs(cells2[j, 0] - cells1[i, 0]) > lat_cells:
+                    continue
+                dcell = abs(cells2[j, 1] - cells1[i, 1])
+                if min(dcell, 360 - dcell) > lon_cells:
+                    continue
+
+                sin_dphi = math.sin((lats2[j] - lats1[i]) * rad / 2)
+                sin_dlam = math.sin((lons2[j] - lons1[i]) * rad / 2)
+                a = sin_dphi * sin_dphi + cos1[i] * cos2[j] * sin_dlam * sin_dlam
+                d = 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+                if d <= max_sep_km:
+                    idx1[count] = i
+                    idx2[count] = j
+                    dist[count] = d
+                    count += 1
+        return idx1[:count], idx2[:count], dist[:count]
+else:
+    def scan_pair(lats1, lons1, cos1, cells1, lo, hi, lats2, lons2, cos2, cells2, lat_cells, lon_cells, max_sep_km):
+        """
+        Compare each nodes1 point i against nodes2[lo[i]:hi[i]] and return the
+        (idx1, idx2, distance_km) arrays of pairs within max_sep_km. Pairs whose
+        (lat, lon) grid cells are further apart than lat_cells/lon_cells are
+        dropped before haversine is evaluated; cos(lat) comes precomputed per
+        node (cos1/cos2).
+        """
+        idx1: List[np.ndarray] = []
+        idx2: List[np.ndarray] = []
+        dist: List[np.ndarray] = []
+        for i in np.flatnonzero(hi > lo).tolist():
+            j0, j1 = int(lo[i]), int(hi[i])
+            dcell = np.abs(cells2[j0:j1] - cells1[i])
+            near = np.flatnonzero(
+                (dcell[:, 0] <= lat_cells) & (np.minimum(dcell[:, 1], 360 - dcell[:, 1]) <= lon_cells)
+            )
+            near_j = j0 + near
+            d = haversine_vector(lats1[i], lons1[i], lats2[near_j], lons2[near_j], cos1[i], cos2[near_j])
+            hits = d <= max_sep_km
+            idx1.append(np.full(np.count_nonzero(hits), i, dtype=np.int64))
+            idx2.append(near[hits] + j0)
+            dist.append(d[hits])
+        if not idx1:
+            return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float64)
+        return np.concatenate(idx1), np.concatenate(idx2), np.concatenate(dist)
+
+
+@lru_cache(maxsize=65536)
+def _parse_ts_str(ts: str) -> Optional[datetime]:
+    # Cached: node timestamps repeat heavily across flights (shared time grid)
+    try:
+        return datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    except Exception:
+        return None
+
+
 def _to_dt(ts: Any) -> Optional[datetime]:
     if ts is None:
         return None
     if isinstance(ts, datetime):
         return ts
     if isinstance(ts, str):
-        try:
-            return datetime.fromisoformat(ts.replace("Z", "+00:00"))
-        except Exception:
-            return None
+        return _parse_ts_str(ts)
     return None
 
 
-def get_flight_data(collection, max_flights: int, sampling: str = "random") -> Dict[int, Dict[str, Any]]:
+def _to_utc_dt(ts: Any) -> Optional[datetime]:
+    """Like _to_dt, but offset-aware values are converted to naive UTC."""
+    dt = _to_dt(ts)
+    if dt is not None and dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _to_datetime64(ts: Any) -> np.datetime64:
+    dt = _to_utc_dt(ts)
+    return np.datetime64("NaT", "us") if dt is None else np.datetime64(dt, "us")
+
+
+def node_arrays(lats: List[Any], lons: List[Any], timestamps: List[Any]) -> Dict[str, np.ndarray]:
     """
-    Retrieve flight data from MongoDB, grouped by flight_id.
-    Returns: {flight_id: {nodes: [...], carrier, tailnum, origin, dest}}
+    Struct-of-arrays form of a flight's nodes, so distance and time-window math
+    runs over whole slices instead of per-node dicts. Timestamps are parsed here
+    once (unparseable ones become NaT).
     """
-    print("Fetching flight IDs...")
-    pipeline = [{"$group": {"_id": "$flight_id"}}]
-    if sampling == "first":
-        pipeline.extend([{"$sort": {"_id": 1}}, {"$limit": int(max_flights)}])
-    else:
-        # Random sampling gives much better variety and usually yields more scenarios
-        pipeline.extend([{"$sample": {"size": int(max_flights)}}])
+    times = np.array([_to_datetime64(ts) for ts in timestamps], dtype="datetime64[us]")
+    lats = np.array(lats, dtype=np.float64)
+    lons = np.array(lons, dtype=np.float64)
+    return {
+        "lats": lats,
+        "lons": lons,
+        # float32 copies for the pair scan (~1 m precision, half the memory
+        # traffic); its trig still runs in float64
+        "lats32": lats.astype(np.float32),
+        "lons32": lons.astype(np.float32),
+        # cos(lat) per node, reused by every pair the flight is scanned in
+        "cos_lats": np.cos(np.radians(lats)),
+        # 1-degree (lat, lon) grid cell per node for the pair scan's prefilter
+        "cells": np.floor(np.column_stack((lats, lons))).astype(np.int16),
+        "times": times,
+    }
 
-    flight_id_docs = list(collection.aggregate(pipeline, allowDiskUse=True))
-    flight_ids = [d["_id"] for d in flight_id_docs if d.get("_id") is not None]
 
-    print(f"Fetching nodes for {len(flight_ids)} flights...")
+def get_flight_metadata(collection, max_flights: int, sampling: str = "random") -> Dict[int, Dict[str, Any]]:
+    """
+    Sample flights and retrieve their per-flight metadata (no nodes), grouped
+    server-side by flight_id. This is all candidate pairing needs.
+    Returns: {flight_id: {carrier, tailnum, origin, dest, t_start, t_end}}
+    """
+    print("Fetching flight metadata...")
     pipeline = [
-        {"$match": {"flight_id": {"$in": flight_ids}}},
-        {"$sort": {"flight_id": 1, "time_index": 1}},
         {
             "$group": {
                 "_id": "$flight_id",
-                "nodes": {
-                    "$push": {
-                        "timestamp": "$timestamp",
-                        "lat": "$lat",
-                        "lon": "$lon",
-                        "time_index": "$time_index",
-                    }
-                },
                 "carrier": {"$first": "$carrier"},
                 "tailnum": {"$first": "$tailnum"},
                 "origin": {"$first": "$origin"},
                 "dest": {"$first": "$dest"},
+                "t_start": {"$min": "$timestamp"},
+                "t_end": {"$max": "$timestamp"},
+                "n_nodes": {"$sum": 1},
             }
         },
+        # Flights with fewer than two nodes can never form a segment
+        {"$match": {"_id": {"$ne": None}, "n_nodes": {"$gte": 2}}},
     ]
+    if sampling == "first":
+        pipeline.extend([{"$sort": {"_id": 1}}, {"$limit": int(max_flights)}])
+    else:
+        # Random sampling gives much better variety and usually yields more scenarios
+        pipeline.extend([{"$sample": {"size": int(max_flights)}}])
 
     flights: Dict[int, Dict[str, Any]] = {}
     for doc in collection.aggregate(pipeline, allowDiskUse=True):
-        flight_id = doc["_id"]
-        flights[int(flight_id)] = {
-            "nodes": doc.get("nodes", []),
+        flights[int(doc["_id"])] = {
             "carrier": doc.get("carrier"),
             "tailnum": doc.get("tailnum"),
             "origin": doc.get("origin"),
             "dest": doc.get("dest"),
+            "t_start": _to_utc_dt(doc.get("t_start")),
+            "t_end": _to_utc_dt(doc.get("t_end")),
         }
 
     print(f"Retrieved {len(flights)} unique flights")
     return flights
 
 
-def get_time_window(flight_data: Dict[str, Any]) -> Tuple[Optional[datetime], Optional[datetime]]:
-    nodes = flight_data.get("nodes") or []
-    timestamps = [_to_dt(n.get("timestamp")) for n in nodes]
-    timestamps = [t for t in timestamps if t is not None]
-    if not timestamps:
-        return None, None
-    return min(timestamps), max(timestamps)
+def get_flight_nodes(collection, flights: Dict[int, Dict[str, Any]], flight_ids: List[int]) -> None:
+    """
+    Fetch nodes for flight_ids (ordered by time_index) and add their column
+    arrays to those flights' metadata dicts in place.
+    """
+    print(f"Fetching nodes for {len(flight_ids)} flights...")
+    pipeline = [
+        {"$match": {"flight_id": {"$in": flight_ids}}},
+        {"$sort": {"flight_id": 1, "time_index": 1}},
+        {
+            "$group": {
+                "_id": "$flight_id",
+                # One array per field instead of a dict per node ($ifNull keeps the
+                # arrays aligned when a node is missing a field)
+                "lats": {"$push": {"$ifNull": ["$lat", None]}},
+                "lons": {"$push": {"$ifNull": ["$lon", None]}},
+                "timestamps": {"$push": {"$ifNull": ["$timestamp", None]}},
+            }
+        },
+    ]
 
+    for doc in collection.aggregate(pipeline, allowDiskUse=True, batchSize=FLIGHT_BATCH_SIZE):
+        flights[int(doc["_id"])].update(node_arrays(doc["lats"], doc["lons"], doc["timestamps"]))
 
-def flights_overlap_in_time(flight1: Dict[str, Any], flight2: Dict[str, Any], max_diff_minutes: int = 60) -> bool:
-    start1, end1 = get_time_window(flight1)
-    start2, end2 = get_time_window(flight2)
-    if None in [start1, end1, start2, end2]:
-        return False
-    tolerance = timedelta(minutes=max_diff_minutes)
-    return (start1 - tolerance <= end2) and (start2 - tolerance <= end1)
+
+def get_time_window(flight_data: Dict[str, Any]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    return flight_data.get("t_start"), flight_data.get("t_end")
 
 
 def find_formation_segment(
@@ -165,92 +328,71 @@ def find_formation_segment(
     Find a segment where two flights can fly in formation.
     More efficient than O(n^2): only compares nodes within the time window.
     """
-    nodes1 = flight1.get("nodes") or []
-    nodes2 = flight2.get("nodes") or []
-    if len(nodes1) < 2 or len(nodes2) < 2:
+    if "lats" not in flight1 or "lats" not in flight2:
         return None
-
-    # Pre-parse timestamps
-    t2_list = [_to_dt(n.get("timestamp")) for n in nodes2]
-    if any(t is None for t in t2_list):
+    lats1, lons1, times1 = flight1["lats"], flight1["lons"], flight1["times"]
+    lats2, lons2, times2 = flight2["lats"], flight2["lons"], flight2["times"]
+    if len(lats1) < 2 or len(lats2) < 2:
+        return None
+    if np.isnat(times2).any():
         # If timestamps are missing/unparseable, fall back to no segment
         return None
 
-    max_dt = timedelta(minutes=max_time_diff_minutes)
-
-    compatible_points: List[Dict[str, Any]] = []
-    j0 = 0
-
-    for i, n1 in enumerate(nodes1):
-        t1 = _to_dt(n1.get("timestamp"))
-        if t1 is None:
-            continue
+    max_dt = np.timedelta64(int(max_time_diff_minutes), "m")
 
-        # Advance j0 so nodes2[j0] is within (t1 - max_dt)
-        while j0 < len(nodes2) and t2_list[j0] < (t1 - max_dt):
-            j0 += 1
-
-        j = j0
-        while j < len(nodes2) and t2_list[j] <= (t1 + max_dt):
-            n2 = nodes2[j]
-            dist = haversine_distance(n1["lat"], n1["lon"], n2["lat"], n2["lon"])
-            if dist <= max_separation_km:
-                time_diff_min = abs((t1 - t2_list[j]).total_seconds() / 60.0)
-                compatible_points.append(
-                    {
-                        "idx1": i,
-                        "idx2": j,
-                        "time1": t1,
-                        "time2": t2_list[j],
-                        "lat1": n1["lat"],
-                        "lon1": n1["lon"],
-                        "lat2": n2["lat"],
-                        "lon2": n2["lon"],
-                        "distance_km": dist,
-                        "time_diff_min": time_diff_min,
-                    }
-                )
-            j += 1
-
-    if not compatible_points:
+    # Per-node window [lo, hi) of nodes2 within +/- max_dt of each nodes1 time
+    lo = np.searchsorted(times2, times1 - max_dt, side="left")
+    hi = np.searchsorted(times2, times1 + max_dt, side="right")
+    hi = np.where(np.isnat(times1), lo, hi)
+    if not (hi > lo).any():
         return None
 
-    # Find the longest "continuous" segment (by idx1 continuity, simple heuristic)
-    compatible_points.sort(key=lambda x: (x["idx1"], x["idx2"]))
-
-    best_segment: List[Dict[str, Any]] = []
-    current_segment: List[Dict[str, Any]] = []
-
-    for point in compatible_points:
-        if not current_segment:
-            current_segment = [point]
-            continue
-
-        prev = current_segment[-1]
-        if point["idx1"] == prev["idx1"] + 1 or point["idx1"] == prev["idx1"]:
-            current_segment.append(point)
-        else:
-            if len(current_segment) > len(best_segment):
-                best_segment = current_segment
-            current_segment = [point]
-
-    if len(current_segment) > len(best_segment):
-        best_segment = current_segment
+    max_abs_lat = max(float(np.abs(lats1).max()), float(np.abs(lats2).max()))
+    lat_cells, lon_cells = grid_reach(float(max_separation_km), max_abs_lat)
+    idx1, idx2, dists = scan_pair(
+        flight1["lats32"], flight1["lons32"], flight1["cos_lats"], flight1["cells"], lo, hi,
+        flight2["lats32"], flight2["lons32"], flight2["cos_lats"], flight2["cells"],
+        lat_cells, lon_cells, float(max_separation_km),
+    )
+    if not idx1.size:
+        return None
 
-    if len(best_segment) < 2:
+    # Find the longest "continuous" segment (by idx1 continuity, simple heuristic):
+    # with points sorted by (idx1, idx2), a run breaks wherever idx1 jumps by more
+    # than one; the first longest run wins.
+    order = np.lexsort((idx2, idx1))
+    idx1, idx2, dists = idx1[order], idx2[order], dists[order]
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(idx1) > 1) + 1, [idx1.size]))
+    best = int(np.argmax(np.diff(bounds)))
+    start, stop = int(bounds[best]), int(bounds[best + 1])
+    if stop - start < 2:
         return None
 
-    join_idx1 = min(p["idx1"] for p in best_segment)
-    split_idx1 = max(p["idx1"] for p in best_segment)
-    join_idx2 = min(p["idx2"] for p in best_segment)
-    split_idx2 = max(p["idx2"] for p in best_segment)
+    # Exact float64 separations for the points that feed the metrics
+    idx1, idx2 = idx1[start:stop], idx2[start:stop]
+    dists = haversine_vector(
+        lats1[idx1], lons1[idx1], lats2[idx2], lons2[idx2], flight1["cos_lats"][idx1], flight2["cos_lats"][idx2]
+    )
+    time_diffs = np.abs(times1[idx1] - times2[idx2]) / np.timedelta64(1, "s") / 60.0
 
     return {
-        "join_index_flight1": join_idx1,
-        "split_index_flight1": split_idx1,
-        "join_index_flight2": join_idx2,
-        "split_index_flight2": split_idx2,
-        "formation_points": best_segment,
+        "join_index_flight1": int(idx1[0]),
+        "split_index_flight1": int(idx1[-1]),
+        "join_index_flight2": int(idx2.min()),
+        "split_index_flight2": int(idx2.max()),
+        # Formation points as parallel arrays, one entry per matched node pair
+        "formation_points": {
+            "idx1": idx1,
+            "idx2": idx2,
+            "time1": times1[idx1],
+            "time2": times2[idx2],
+            "lat1": lats1[idx1],
+            "lon1": lons1[idx1],
+            "lat2": lats2[idx2],
+            "lon2": lons2[idx2],
+            "distance_km": dists,
+            "time_diff_min": time_diffs,
+        },
     }
 
 
@@ -258,30 +400,25 @@ def calculate_formation_metrics(
     segment_info: Dict[str, Any],
     min_formation_minutes: int,
 ) -> Optional[Dict[str, Any]]:
-    points = segment_info.get("formation_points") or []
-    if len(points) < 2:
+    points = segment_info.get("formation_points") or {}
+    if len(points.get("idx1", ())) < 2:
         return None
 
-    start_time = points[0]["time1"]
-    end_time = points[-1]["time1"]
-    formation_minutes = (end_time - start_time).total_seconds() / 60.0
+    time1 = points["time1"]
+    formation_minutes = (time1[-1] - time1[0]) / np.timedelta64(1, "s") / 60.0
     if formation_minutes < min_formation_minutes:
         return None
 
-    formation_distance_km = 0.0
-    for i in range(1, len(points)):
-        p1 = points[i - 1]
-        p2 = points[i]
-        formation_distance_km += haversine_distance(p1["lat1"], p1["lon1"], p2["lat1"], p2["lon1"])
+    lats, lons = points["lat1"], points["lon1"]
+    formation_distance_km = float(haversine_vector(lats[:-1], lons[:-1], lats[1:], lons[1:]).sum())
 
-    avg_separation = sum(p["distance_km"] for p in points) / len(points)
+    avg_separation = sum(points["distance_km"].tolist()) / len(points["distance_km"])
     detour_km = avg_separation * 0.5
 
     fuel_saved_kg = formation_distance_km * FUEL_BURN_RATE_KG_PER_KM * FUEL_SAVINGS_RATE
     co2_saved_kg = fuel_saved_kg * CO2_PER_KG_FUEL
 
-    detour_penalty = detour_km * 0.5
-    score = co2_saved_kg - detour_penalty
+    score = co2_saved_kg - detour_km * 0.5
 
     return {
         "formation_minutes": round(formation_minutes, 1),
@@ -298,32 +435,31 @@ def _clamp(x: float, lo: float, hi: float) -> float:
     return lo if x < lo else hi if x > hi else x
 
 
-def _lerp(a: float, b: float, t: float) -> float:
-    return a + (b - a) * t
-
-
 def resample_nodes_to_points(
-    nodes: List[Dict[str, Any]],
+    lats: np.ndarray,
+    lons: np.ndarray,
     n_points: int,
     *,
     round_decimals: int = 5,
     base_step_seconds: float = 20.0,
+    include_time: bool = True,
 ) -> List[Dict[str, Any]]:
     """
-    Resample raw flight nodes into a fixed-length list of {t, lon, lat} points.
+    Resample a flight's node coordinates into a fixed-length list of {t, lon, lat}
+    points ({lon, lat} when include_time is False).
 
     Why: the frontend replay interpolates by array index (uniform progress), not
     by timestamp. If the raw nodes are sparse/irregular, the plane can appear
     to "jump". Resampling both leader and follower to the same length yields
     smooth, consistent motion and smoother split transitions.
     """
-    if not nodes:
+    raw_len = len(lats)
+    if not raw_len:
         return []
-    if len(nodes) == 1:
-        n = nodes[0]
-        return [{"t": 0, "lon": round(float(n["lon"]), round_decimals), "lat": round(float(n["lat"]), round_decimals)}]
+    if raw_len == 1:
+        point = {"lon": round(float(lons[0]), round_decimals), "lat": round(float(lats[0]), round_decimals)}
+        return [{"t": 0, **point}] if include_time else [point]
 
-    raw_len = len(nodes)
     n_points = int(_clamp(n_points, 2, MAX_REPLAY_POINTS))
 
     # Preserve "nominal" duration implied by prior i*20 encoding.
@@ -331,26 +467,30 @@ def resample_nodes_to_points(
     if n_points <= 1 or total_duration <= 0:
         total_duration = float(base_step_seconds)
 
-    out: List[Dict[str, Any]] = []
-    for i in range(n_points):
-        # Position along the raw polyline in "node index space"
-        u = (i / (n_points - 1)) * (raw_len - 1)
-        j = int(math.floor(u))
-        t = u - j
-        j2 = min(j + 1, raw_len - 1)
-
-        n1 = nodes[j]
-        n2 = nodes[j2]
-        lon = _lerp(float(n1["lon"]), float(n2["lon"]), t)
-        lat = _lerp(float(n1["lat"]), float(n2["lat"]), t)
-
-        # Time in seconds across the resampled track (not used by current replay,
-        # but useful for debugging and future improvements).
-        tt = (i / (n_points - 1)) * total_duration
-
-        out.append({"t": round(tt, 3), "lon": round(lon, round_decimals), "lat": round(lat, round_decimals)})
-
-    return out
+    # Position along the raw polyline in "node index space", interpolated
+    # between the bracketing nodes j and j2
+    progress = np.arange(n_points) / (n_points - 1)
+    u = progress * (raw_len - 1)
+    j = np.floor(u).astype(np.int64)
+    t = u - j
+    j2 = np.minimum(j + 1, raw_len - 1)
+    lon = lons[j] + (lons[j2] - lons[j]) * t
+    lat = lats[j] + (lats[j2] - lats[j]) * t
+
+    # round() (not np.round) keeps the emitted decimals correctly rounded
+    if not include_time:
+        return [
+            {"lon": round(b, round_decimals), "lat": round(c, round_decimals)}
+            for b, c in zip(lon.tolist(), lat.tolist())
+        ]
+
+    # Time in seconds across the resampled track (the replay reads the last
+    # point's t as the track duration).
+    tt = progress * total_duration
+    return [
+        {"t": round(a, 3), "lon": round(b, round_decimals), "lat": round(c, round_decimals)}
+        for a, b, c in zip(tt.tolist(), lon.tolist(), lat.tolist())
+    ]
 
 
 def build_scenario(
@@ -361,20 +501,22 @@ def build_scenario(
     segment_info: Dict[str, Any],
     metrics: Dict[str, Any],
     scenario_id: str,
+    include_point_times: bool = True,
 ) -> Dict[str, Any]:
-    nodes1 = flight1_data["nodes"]
-    nodes2 = flight2_data["nodes"]
-
     # Build a denser, equal-length replay track for leader & follower so the
     # follower doesn't "jump" when rejoining its own path after split.
     target_points = int(_clamp(TARGET_REPLAY_POINTS, 2, MAX_REPLAY_POINTS))
 
-    leader_points = resample_nodes_to_points(nodes1, target_points)
-    follower_points = resample_nodes_to_points(nodes2, target_points)
+    leader_points = resample_nodes_to_points(
+        flight1_data["lats"], flight1_data["lons"], target_points, include_time=include_point_times
+    )
+    follower_points = resample_nodes_to_points(
+        flight2_data["lats"], flight2_data["lons"], target_points, include_time=include_point_times
+    )
 
     # Map formation join/split from raw leader indices into resampled indices.
     # (Formation segment detection is done on raw nodes.)
-    denom = max(1, (len(nodes1) - 1))
+    denom = max(1, (len(flight1_data["lats"]) - 1))
     join_frac = float(segment_info["join_index_flight1"]) / denom
     split_frac = float(segment_info["split_index_flight1"]) / denom
     join_idx = int(round(join_frac * (target_points - 1)))
@@ -391,9 +533,8 @@ def build_scenario(
     else:
         savings_preset = "conservative"
 
-    def first_date(nodes: List[Dict[str, Any]]) -> str:
-        ts = _to_dt(nodes[0].get("timestamp")) if nodes else None
-        return ts.strftime("%Y-%m-%d") if ts else ""
+    def first_date(times: np.ndarray) -> str:
+        return str(times[0].astype("datetime64[D]")) if times.size and not np.isnat(times[0]) else ""
 
     carrier1 = flight1_data.get("carrier") or ""
     carrier2 = flight2_data.get("carrier") or ""
@@ -409,7 +550,7 @@ def build_scenario(
             "route": f"{flight1_data.get('origin','?')}-{flight1_data.get('dest','?')}",
             "airline": carrier1,
             "aircraft": "Unknown",
-            "date": first_date(nodes1),
+            "date": first_date(flight1_data["times"]),
             "points": leader_points,
         },
         "follower": {
@@ -418,7 +559,7 @@ def build_scenario(
             "route": f"{flight2_data.get('origin','?')}-{flight2_data.get('dest','?')}",
             "airline": carrier2,
             "aircraft": "Unknown",
-            "date": first_date(nodes2),
+            "date": first_date(flight2_data["times"]),
             "points": follower_points,
         },
         "joinIndex": int(join_idx),
@@ -459,52 +600,148 @@ def generate_rankings(scenarios: List[Dict[str, Any]], metrics_by_id: Dict[str,
 def find_candidate_pairs_by_origin_or_dest(
     flights: Dict[int, Dict[str, Any]], max_pairs: int
 ) -> List[Tuple[int, int]]:
-    by_origin: Dict[str, List[int]] = defaultdict(list)
-    by_dest: Dict[str, List[int]] = defaultdict(list)
+    """
+    Up to max_pairs unique (f1, f2) flight pairs, f1 < f2, sharing an origin or
+    destination and overlapping in time. Pairs are accumulated once, in the
+    order they are found, in a dict keyed by the pair (no separate dedupe pass).
+    """
+    # One bucket per ("O", origin) and ("D", dest) key holding (start, end, flight_id);
+    # flights without any parseable timestamp can't be paired
+    by_key: Dict[Tuple[str, str], List[Tuple[datetime, datetime, int]]] = defaultdict(list)
     for flight_id, data in flights.items():
-        origin = data.get("origin")
-        if origin:
-            by_origin[str(origin)].append(flight_id)
-        dest = data.get("dest")
-        if dest:
-            by_dest[str(dest)].append(flight_id)
-
-    candidates: List[Tuple[int, int]] = []
-
-    def add_group(ids: List[int]) -> None:
-        nonlocal candidates
-        ids = sorted(set(ids))
-        for f1, f2 in combinations(ids, 2):
-            if len(candidates) >= max_pairs:
-                return
-            if flights_overlap_in_time(flights[f1], flights[f2]):
-                candidates.append((f1, f2))
+        start, end = get_time_window(data)
+        if start is None or end is None:
+            continue
+        for kind, field in (("O", "origin"), ("D", "dest")):
+            value = data.get(field)
+            if value:
+                by_key[(kind, str(value))].append((start, end, flight_id))
+    tolerance = timedelta(minutes=CANDIDATE_OVERLAP_MINUTES)
+
+    # Pairs are keyed by (f1, f2) with f1 < f2, so a pair sharing both origin and
+    # dest is only kept once (dicts keep insertion order)
+    candidates: Dict[Tuple[int, int], None] = {}
+
+    def add_group(group: List[Tuple[datetime, datetime, int]]) -> None:
+        # Sweep flights in start order, keeping a heap of earlier flights keyed by
+        # end time: anything still in it once those ending before start - tolerance
+        # are popped overlaps the current flight, i.e. each window starts no later
+        # than tolerance after the other one ends.
+        active: List[Tuple[datetime, int]] = []
+        pairs: List[Tuple[int, int]] = []
+        for start, end, flight_id in sorted(group, key=lambda w: w[0]):
+            while active and active[0][0] < start - tolerance:
+                heapq.heappop(active)
+            pairs.extend((other, flight_id) if other < flight_id else (flight_id, other) for _, other in active)
+            heapq.heappush(active, (end, flight_id))
+
+        # Emit in (f1, f2) id order so --max-pairs keeps the lowest-id pairs of a group
+        pairs.sort()
+        new_pairs = (pair for pair in pairs if pair not in candidates)
+        candidates.update(dict.fromkeys(islice(new_pairs, max(0, max_pairs - len(candidates)))))
 
     # Prefer same-origin groups first (often yields similar routes),
-    # then same-destination groups to increase coverage.
-    for _, ids in sorted(by_origin.items(), key=lambda kv: len(kv[1]), reverse=True):
+    # then same-destination groups to increase coverage; larger groups first.
+    for _, group in sorted(by_key.items(), key=lambda kv: (kv[0][0] != "O", -len(kv[1]))):
         if len(candidates) >= max_pairs:
             break
-        add_group(ids)
+        add_group(group)
 
-    for _, ids in sorted(by_dest.items(), key=lambda kv: len(kv[1]), reverse=True):
-        if len(candidates) >= max_pairs:
-            break
-        add_group(ids)
-
-    # Deduplicate exact flight-id pairs (origin and dest grouping can overlap)
-    uniq = []
-    seen = set()
-    for a, b in candidates:
-        key = (a, b) if a < b else (b, a)
-        if key in seen:
-            continue
-        seen.add(key)
-        uniq.append(key)
-        if len(uniq) >= max_pairs:
-            break
+    return list(candidates)
+
+
+# Flights table read by process_pair; filled in by main() before worker processes
+# are forked so they inherit it instead of receiving flights with every task.
+PAIR_FLIGHTS: Dict[int, Dict[str, Any]] = {}
+
+
+def process_pair(
+    pair: Tuple[int, int],
+    max_separation_km: float,
+    max_time_diff_minutes: int,
+    min_formation_minutes: int,
+    include_point_times: bool = True,
+) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Formation detection, metrics and scenario for one candidate pair, or None if
+    the pair yields no positive-score formation. The scenario id is left empty
+    for the caller to assign in candidate order.
+    """
+    f1_id, f2_id = pair
+    flight1 = PAIR_FLIGHTS[f1_id]
+    flight2 = PAIR_FLIGHTS[f2_id]
+
+    segment = find_formation_segment(
+        flight1,
+        flight2,
+        max_separation_km=max_separation_km,
+        max_time_diff_minutes=max_time_diff_minutes,
+    )
+    if not segment:
+        return None
+
+    metrics = calculate_formation_metrics(segment, min_formation_minutes=min_formation_minutes)
+    if not metrics:
+        return None
+    if metrics["score"] <= 0:
+        return None
+
+    scenario = build_scenario(f1_id, f2_id, flight1, flight2, segment, metrics, "", include_point_times)
+    return scenario, metrics
 
-    return uniq
+
+def dumps_json(data: Any) -> bytes:
+    """Indented JSON bytes (orjson when available, else stdlib json)."""
+    if HAS_ORJSON:
+        return orjson.dumps(data, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(data, indent=2, default=str).encode()
+
+
+def write_json(path: str, data: Any) -> None:
+    with open(path, "wb") as f:
+        f.write(dumps_json(data))
+
+
+class ScenarioSpool:
+    """
+    Serialize scenarios to an anonymous temp file as they are built, keeping only
+    their offsets in memory, then copy them into the output JSON array in ranked
+    order. Peak memory is one scenario's replay points instead of all of them.
+    """
+
+    def __init__(self) -> None:
+        self.file = tempfile.TemporaryFile()
+        self.spans: Dict[str, Tuple[int, int]] = {}
+
+    def add(self, scenario: Dict[str, Any]) -> None:
+        # Indent one level deeper so the element nests inside the top-level array
+        data = dumps_json(scenario).replace(b"\n", b"\n  ")
+        self.spans[scenario["id"]] = (self.file.tell(), len(data))
+        self.file.write(data)
+
+    def write_array(self, path: str, scenario_ids: List[str]) -> None:
+        with open(path, "wb") as f:
+            if not scenario_ids:
+                f.write(b"[]")
+                return
+            for n, scenario_id in enumerate(scenario_ids):
+                offset, length = self.spans[scenario_id]
+                self.file.seek(offset)
+                f.write(b"[\n  " if n == 0 else b",\n  ")
+                f.write(self.file.read(length))
+            f.write(b"\n]")
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def scenario_summary(scenario: Dict[str, Any]) -> Dict[str, Any]:
+    """Scenario without its replay points (what generate_rankings reads)."""
+    return {
+        **scenario,
+        "leader": {k: v for k, v in scenario["leader"].items() if k != "points"},
+        "follower": {k: v for k, v in scenario["follower"].items() if k != "points"},
+    }
 
 
 def main() -> int:
@@ -523,6 +760,19 @@ def main() -> int:
         default="random",
         help="How to choose flight_ids from flight_nodes (random yields more variety).",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Worker processes for formation detection (1 = run in-process).",
+    )
+    parser.add_argument(
+        "--omit-point-times",
+        dest="include_point_times",
+        action="store_false",
+        help="Emit replay points as {lon, lat} only: a smaller scenarios.json for consumers that "
+        "don't replay by time (the frontend replay controller reads t).",
+    )
     args = parser.parse_args()
 
     mongo_uri = os.getenv("MONGODB_URI") or os.getenv("MONGO_ATLAS_URI") or "mongodb://localhost:27017/"
@@ -541,7 +791,7 @@ def main() -> int:
     db = client[db_name]
     col = db[collection_name]
 
-    flights = get_flight_data(col, max_flights=args.max_flights, sampling=args.flight_id_sampling)
+    flights = get_flight_metadata(col, max_flights=args.max_flights, sampling=args.flight_id_sampling)
     if len(flights) < 2:
         print("Not enough flights to generate scenarios.")
         return 1
@@ -550,38 +800,70 @@ def main() -> int:
     candidates = find_candidate_pairs_by_origin_or_dest(flights, max_pairs=args.max_pairs)
     print(f"Candidates: {len(candidates)}")
 
+    # Only flights that made it into a candidate pair need their nodes
+    get_flight_nodes(col, flights, sorted({flight_id for pair in candidates for flight_id in pair}))
+
     scenarios: List[Dict[str, Any]] = []
     metrics_by_id: Dict[str, Dict[str, Any]] = {}
+    spool = ScenarioSpool()
+
+    PAIR_FLIGHTS.clear()
+    PAIR_FLIGHTS.update(flights)
+    pair_task = partial(
+        process_pair,
+        max_separation_km=args.max_separation_km,
+        max_time_diff_minutes=args.max_time_diff_minutes,
+        min_formation_minutes=args.min_formation_minutes,
+        include_point_times=args.include_point_times,
+    )
 
-    for idx, (f1_id, f2_id) in enumerate(candidates):
-        if len(scenarios) >= args.max_scenarios:
-            break
-
-        flight1 = flights[f1_id]
-        flight2 = flights[f2_id]
-
-        segment = find_formation_segment(
-            flight1,
-            flight2,
-            max_separation_km=args.max_separation_km,
-            max_time_diff_minutes=args.max_time_diff_minutes,
+    # Workers are forked so they inherit PAIR_FLIGHTS (not available on Windows:
+    # run pairs in-process). Pairs are mapped a batch at a time and results taken
+    # in candidate order, so scenario ids and the --max-scenarios cutoff match a
+    # serial run and at most one batch is wasted after the cutoff.
+    num_workers = max(1, min(args.workers, len(candidates)))
+    executor = None
+    if HAS_NUMBA:
+        # Compile (or load from numba's on-disk cache) once here rather than in
+        # every forked worker on its first pair
+        empty_f32, empty_f64, empty_i64 = np.empty(0, np.float32), np.empty(0, np.float64), np.empty(0, np.int64)
+        empty_cells = np.empty((0, 2), np.int16)
+        scan_pair(
+            empty_f32, empty_f32, empty_f64, empty_cells, empty_i64, empty_i64,
+            empty_f32, empty_f32, empty_f64, empty_cells, 1, 1, 1.0,
         )
-        if not segment:
-            continue
-
-        metrics = calculate_formation_metrics(segment, min_formation_minutes=args.min_formation_minutes)
-        if not metrics:
-            continue
-        if metrics["score"] <= 0:
-            continue
-
-        scenario_id = f"scenario-{len(scenarios) + 1}"
-        scenario = build_scenario(f1_id, f2_id, flight1, flight2, segment, metrics, scenario_id)
-        scenarios.append(scenario)
-        metrics_by_id[scenario_id] = metrics
-
-        if (idx + 1) % 100 == 0:
-            print(f"Processed {idx+1}/{len(candidates)} pairs -> {len(scenarios)} scenarios")
+    if num_workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+        executor = ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context("fork"))
+    batch_size = num_workers * 64
+
+    try:
+        for batch_start in range(0, len(candidates), batch_size):
+            if len(scenarios) >= args.max_scenarios:
+                break
+            batch = candidates[batch_start : batch_start + batch_size]
+            if executor:
+                results = executor.map(pair_task, batch, chunksize=16)
+            else:
+                results = map(pair_task, batch)
+
+            for idx, result in enumerate(results, batch_start):
+                if len(scenarios) >= args.max_scenarios:
+                    break
+                if result is None:
+                    continue
+
+                scenario, metrics = result
+                scenario_id = f"scenario-{len(scenarios) + 1}"
+                scenario["id"] = scenario_id
+                spool.add(scenario)
+                scenarios.append(scenario_summary(scenario))
+                metrics_by_id[scenario_id] = metrics
+
+                if (idx + 1) % 100 == 0:
+                    print(f"Processed {idx+1}/{len(candidates)} pairs -> {len(scenarios)} scenarios")
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
 
     # Rank scenarios by score (descending) and re-number ranks in matches.json accordingly
     scenarios.sort(key=lambda s: metrics_by_id[s["id"]]["score"], reverse=True)
@@ -589,12 +871,11 @@ def main() -> int:
 
     # Write outputs
     print(f"\nWriting scenarios -> {args.out_scenarios}")
-    with open(args.out_scenarios, "w") as f:
-        json.dump(scenarios, f, indent=2, default=str)
+    spool.write_array(args.out_scenarios, [s["id"] for s in scenarios])
+    spool.close()
 
     print(f"Writing matches -> {args.out_matches}")
-    with open(args.out_matches, "w") as f:
-        json.dump(rankings, f, indent=2)
+    write_json(args.out_matches, rankings)
 
     print(f"\n✓ Wrote {len(scenarios)} scenarios and {len(rankings)} ranked matches")
     client.close()
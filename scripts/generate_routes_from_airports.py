@@ -11,9 +11,19 @@ from datetime import datetime, timedelta
 import argparse
 from pathlib import Path
 import json
+from types import MappingProxyType
+from dateutil.tz import tzlocal
+
+# Try to import pyarrow for its multithreaded CSV writer, but make it optional
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
 
 # Common airport coordinates (ICAO codes)
-AIRPORT_COORDS = {
+_AIRPORT_COORDS = {
     # US airports
     'KSFO': (37.6213, -122.3790),  # San Francisco
     'KLAX': (33.9425, -118.4081),  # Los Angeles
@@ -64,7 +74,6 @@ AIRPORT_COORDS = {
     'EHAM': (52.3105, 4.7683),      # Amsterdam
     'LIRF': (41.8003, 12.2389),     # Rome Fiumicino
     'LEMD': (40.4839, -3.5680),     # Madrid
-    'LFPG': (49.0097, 2.5479),      # Paris CDG
     'CYVR': (49.1947, -123.1792),   # Vancouver
     'CYYZ': (43.6772, -79.6306),    # Toronto
     'CYMX': (45.4577, -73.7497),    # Montreal
@@ -80,118 +89,194 @@ AIRPORT_COORDS = {
     'SFO': (37.6213, -122.3790),    # SFO (IATA)
 }
 
+# Frozen lookup table: every code above plus the 3-letter IATA form of each
+# US 'K' ICAO code, so a lookup is a single dict get
+AIRPORT_COORDS = MappingProxyType({
+    **_AIRPORT_COORDS,
+    **{code[1:]: coords for code, coords in _AIRPORT_COORDS.items()
+       if code.startswith('K') and len(code) == 4 and code[1:] not in _AIRPORT_COORDS},
+})
+
 
 def get_airport_coords(airport_code):
     """Get airport coordinates, handling both ICAO and IATA codes."""
     if not airport_code or pd.isna(airport_code):
         return None
     
-    airport_code = str(airport_code).strip().upper()
-    
-    # Try direct lookup
-    if airport_code in AIRPORT_COORDS:
-        return AIRPORT_COORDS[airport_code]
+    return AIRPORT_COORDS.get(str(airport_code).strip().upper())
+
+
+# Array form of AIRPORT_COORDS for vectorized lookups: AIRPORT_INDEX maps a
+# code to its row in AIRPORT_LAT/AIRPORT_LON, whose extra last row is NaN so
+# unknown codes (index -1) gather NaN
+AIRPORT_INDEX = {code: i for i, code in enumerate(AIRPORT_COORDS)}
+AIRPORT_LAT = np.array([lat for lat, _ in AIRPORT_COORDS.values()] + [np.nan])
+AIRPORT_LON = np.array([lon for _, lon in AIRPORT_COORDS.values()] + [np.nan])
+
+
+def map_airport_coords(airport_codes):
+    """
+    Vectorized get_airport_coords over a Series of airport codes.
     
-    # Try with K prefix (US airports)
-    if len(airport_code) == 3:
-        k_code = 'K' + airport_code
-        if k_code in AIRPORT_COORDS:
-            return AIRPORT_COORDS[k_code]
+    Returns (lat, lon) float arrays aligned to airport_codes; NaN where the code
+    is missing or unknown (same lookup as get_airport_coords).
+    """
+    codes = airport_codes.astype(str).str.strip().str.upper().where(airport_codes.notna())
+    index = codes.map(AIRPORT_INDEX).fillna(-1).to_numpy(dtype=np.int64)
     
-    return None
+    return AIRPORT_LAT[index], AIRPORT_LON[index]
 
 
 def calculate_heading(lat1, lon1, lat2, lon2):
-    """Calculate heading (bearing) from point 1 to point 2 in degrees."""
-    import math
-    
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lon = math.radians(lon2 - lon1)
+    """Calculate heading (bearing) from point 1 to point 2 in degrees (scalars or arrays)."""
+    lat1_rad = np.radians(lat1)
+    lat2_rad = np.radians(lat2)
+    delta_lon = np.radians(np.subtract(lon2, lon1))
     
-    y = math.sin(delta_lon) * math.cos(lat2_rad)
-    x = math.cos(lat1_rad) * math.sin(lat2_rad) - math.sin(lat1_rad) * math.cos(lat2_rad) * math.cos(delta_lon)
+    y = np.sin(delta_lon) * np.cos(lat2_rad)
+    x = np.cos(lat1_rad) * np.sin(lat2_rad) - np.sin(lat1_rad) * np.cos(lat2_rad) * np.cos(delta_lon)
     
-    heading = math.atan2(y, x)
-    heading = math.degrees(heading)
+    heading = np.degrees(np.arctan2(y, x))
     heading = (heading + 360) % 360
     
     return heading
 
 
 def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate great circle distance in kilometers."""
-    import math
-    
+    """Calculate great circle (haversine) distance in kilometers (scalars or arrays)."""
     R = 6371  # Earth radius in km
     
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lon = math.radians(lon2 - lon1)
+    lat1_rad = np.radians(lat1)
+    lat2_rad = np.radians(lat2)
+    delta_lat = np.radians(np.subtract(lat2, lat1))
+    delta_lon = np.radians(np.subtract(lon2, lon1))
     
-    a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    a = np.sin(delta_lat/2)**2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(delta_lon/2)**2
+    c = 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
     
     return R * c
 
 
-def generate_flight_path(dep_airport, arr_airport, start_time, duration_seconds, num_points=10):
+def format_iso_times(times):
+    """
+    Format a datetime64[us] array like datetime.isoformat(): seconds precision,
+    with microseconds only when they are non-zero.
+    """
+    has_micros = times.astype(np.int64) % 1_000_000 != 0
+    return np.where(has_micros,
+                    np.datetime_as_string(times, unit='us'),
+                    np.datetime_as_string(times, unit='s')).astype(object)
+
+
+def flight_start_times(epoch_seconds):
+    """
+    Convert a Series of Unix timestamps to naive local datetime64[us] start
+    times (like datetime.fromtimestamp) in one pass. Missing, unparseable or
+    out-of-range values fall back to two hours ago.
+    """
+    fallback = np.datetime64(datetime.now() - timedelta(hours=2), 'us')
+    seconds = pd.to_numeric(epoch_seconds, errors='coerce')
+    seconds = seconds.where(seconds.abs() < 9e9)  # Within pandas' datetime range
+    
+    micros = (seconds * 1e6).round()
+    local_times = (pd.to_datetime(micros, unit='us', utc=True)
+                   .dt.tz_convert(tzlocal())
+                   .dt.tz_localize(None)
+                   .to_numpy(dtype='datetime64[us]'))
+    return np.where(np.isnat(local_times), fallback, local_times)
+
+
+def flight_path_arrays(dep_coords, arr_coords, start_time, duration_seconds, num_points=10, rng=None):
+    """
+    Generate flight path points between two resolved airports as arrays.
+    
+    rng is the np.random.Generator for the position/altitude/speed noise
+    (a fresh unseeded one if omitted).
+    
+    Returns dict of equal-length arrays: latitude, longitude, heading, time
+    (datetime64[us]), altitude, speed.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    dep_lat, dep_lon = dep_coords
+    arr_lat, arr_lon = arr_coords
+    
+    # Altitude/speed noise for every point in one draw
+    cruise_noise = rng.standard_normal((num_points, 2)) * np.array([2000, 50])
+    
+    # Interpolate every point's position at once
+    progress = np.arange(num_points) / (num_points - 1) if num_points > 1 else np.zeros(num_points)
+    
+    # Simple linear interpolation (could use great circle for more accuracy)
+    lats = dep_lat + (arr_lat - dep_lat) * progress
+    lons = dep_lon + (arr_lon - dep_lon) * progress
+    
+    # Add some realistic variation (aircraft don't fly perfectly straight):
+    # one jitter draw for the interior points only, the endpoints stay on the airports
+    if num_points > 2:
+        jitter = rng.standard_normal((num_points - 2, 2)) * 0.1
+        lats[1:-1] += jitter[:, 0]
+        lons[1:-1] += jitter[:, 1]
+    
+    # Calculate timestamps (rounded to the microsecond like timedelta)
+    offsets = np.round(duration_seconds * progress * 1e6).astype('timedelta64[us]')
+    times = np.datetime64(start_time, 'us') + offsets
+    
+    altitudes = 35000 + cruise_noise[:, 0]  # Typical cruise altitude
+    speeds = 450 + cruise_noise[:, 1]  # Typical cruise speed in knots
+    
+    # Heading at each point (toward destination) in one array call; the last
+    # point keeps the initial heading (departure toward destination)
+    heading_lats = lats.copy()
+    heading_lons = lons.copy()
+    if num_points:
+        heading_lats[-1] = dep_lat
+        heading_lons[-1] = dep_lon
+    headings = calculate_heading(heading_lats, heading_lons, arr_lat, arr_lon)
+    
+    return {
+        'latitude': lats,
+        'longitude': lons,
+        'heading': headings,
+        'time': times,
+        'altitude': altitudes,
+        'speed': speeds,
+    }
+
+
+def generate_flight_path(dep_airport, arr_airport, start_time, duration_seconds, num_points=10,
+                         dep_coords=None, arr_coords=None, rng=None):
     """
     Generate flight path points between two airports.
     
+    dep_coords/arr_coords may be passed when the caller already resolved them
+    (e.g. with map_airport_coords); otherwise they are looked up from the codes.
+    
     Returns list of (lat, lon, heading, timestamp) tuples.
     """
-    dep_coords = get_airport_coords(dep_airport)
-    arr_coords = get_airport_coords(arr_airport)
+    if dep_coords is None:
+        dep_coords = get_airport_coords(dep_airport)
+    if arr_coords is None:
+        arr_coords = get_airport_coords(arr_airport)
     
     if not dep_coords or not arr_coords:
         return []
     
-    dep_lat, dep_lon = dep_coords
-    arr_lat, arr_lon = arr_coords
-    
-    # Calculate initial heading
-    heading = calculate_heading(dep_lat, dep_lon, arr_lat, arr_lon)
-    
-    # Generate points along the route
-    points = []
-    for i in range(num_points):
-        # Interpolate position
-        progress = i / (num_points - 1) if num_points > 1 else 0
-        
-        # Simple linear interpolation (could use great circle for more accuracy)
-        lat = dep_lat + (arr_lat - dep_lat) * progress
-        lon = dep_lon + (arr_lon - dep_lon) * progress
-        
-        # Add some realistic variation (aircraft don't fly perfectly straight)
-        if 0 < progress < 1:
-            # Add slight random variation
-            lat += np.random.normal(0, 0.1)
-            lon += np.random.normal(0, 0.1)
-        
-        # Calculate heading at this point (toward destination)
-        if i < num_points - 1:
-            point_heading = calculate_heading(lat, lon, arr_lat, arr_lon)
-        else:
-            point_heading = heading
-        
-        # Calculate timestamp
-        timestamp = start_time + timedelta(seconds=duration_seconds * progress)
-        
-        points.append({
-            'latitude': lat,
-            'longitude': lon,
-            'heading': point_heading,
-            'time': timestamp.isoformat(),
-            'altitude': 35000 + np.random.normal(0, 2000),  # Typical cruise altitude
-            'speed': 450 + np.random.normal(0, 50)  # Typical cruise speed in knots
-        })
-    
-    return points
+    path = flight_path_arrays(dep_coords, arr_coords, start_time, duration_seconds, num_points, rng)
+    path['time'] = format_iso_times(path['time'])
+    columns = {name: values.tolist() for name, values in path.items()}
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
 
+def write_csv(df, path):
+    """Write a dataframe to CSV (without index), using pyarrow's writer when available."""
+    if HAS_PYARROW:
+        pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), str(path))
+    else:
+        df.to_csv(path, index=False)
 
-def generate_routes_from_csv(input_csv, output_csv, points_per_flight=8):
+
+def generate_routes_from_csv(input_csv, output_csv, points_per_flight=8, seed=None):
     """
     Generate flight routes from airport pairs in CSV.
     
@@ -199,7 +284,9 @@ def generate_routes_from_csv(input_csv, output_csv, points_per_flight=8):
         input_csv: Input CSV with airport codes
         output_csv: Output CSV with flight positions
         points_per_flight: Number of position points to generate per flight
+        seed: Random seed for the path noise (None = unseeded)
     """
+    rng = np.random.default_rng(seed)
     print(f"Loading flight data from {input_csv}...")
     df = pd.read_csv(input_csv)
     
@@ -235,69 +322,75 @@ def generate_routes_from_csv(input_csv, output_csv, points_per_flight=8):
     # Find callsign column
     callsign_col = next((c for c in df.columns if 'callsign' in c.lower()), 'callsign')
     
-    all_flight_points = []
+    # Resolve every flight's airport coordinates up front
+    missing_col = pd.Series(index=df.index, dtype=object)
+    dep_lats, dep_lons = map_airport_coords(df.get(dep_col, missing_col))
+    arr_lats, arr_lons = map_airport_coords(df.get(arr_col, missing_col))
+    has_coords = ~np.isnan(dep_lats) & ~np.isnan(arr_lats)
+    
+    # Estimate flight durations from distance, assuming an average speed of 800 km/h
+    durations_seconds = calculate_distance(dep_lats, dep_lons, arr_lats, arr_lons) / 800 * 3600
+    
+    # Flight start times (the time column holds Unix timestamps)
+    start_times = flight_start_times(df.get(time_col, missing_col))
+    
+    # Struct-of-arrays output, filled one flight slice at a time
+    total_points = int(has_coords.sum()) * max(points_per_flight, 0)
+    point_columns = {
+        'latitude': np.empty(total_points),
+        'longitude': np.empty(total_points),
+        'heading': np.empty(total_points),
+        'time': np.empty(total_points, dtype='datetime64[us]'),
+        'altitude': np.empty(total_points),
+        'speed': np.empty(total_points),
+    }
+    offset = 0
     flights_processed = 0
     flights_skipped = 0
     
-    for idx, row in df.iterrows():
-        dep_airport = row.get(dep_col)
-        arr_airport = row.get(arr_col)
-        callsign = row.get(callsign_col, f'FLIGHT{idx}')
-        
-        # Skip if missing airports
-        if pd.isna(dep_airport) or pd.isna(arr_airport):
+    # Everything else is already resolved per flight, so the loop only walks
+    # the index labels (no per-row Series)
+    for pos, idx in enumerate(df.index):
+        # Skip if missing airports or coordinates
+        if not has_coords[pos]:
             flights_skipped += 1
             continue
         
-        # Get coordinates
-        dep_coords = get_airport_coords(dep_airport)
-        arr_coords = get_airport_coords(arr_airport)
-        
-        if not dep_coords or not arr_coords:
-            flights_skipped += 1
-            continue
-        
-        # Calculate flight duration
-        start_time_val = row.get(time_col)
-        if pd.isna(start_time_val):
-            start_time = datetime.now() - timedelta(hours=2)
-        else:
-            try:
-                start_time = datetime.fromtimestamp(float(start_time_val))
-            except:
-                start_time = datetime.now() - timedelta(hours=2)
-        
-        # Estimate flight duration based on distance
-        distance_km = calculate_distance(dep_coords[0], dep_coords[1], arr_coords[0], arr_coords[1])
-        # Assume average speed of 800 km/h
-        duration_hours = distance_km / 800
-        duration_seconds = duration_hours * 3600
+        dep_coords = (dep_lats[pos], dep_lons[pos])
+        arr_coords = (arr_lats[pos], arr_lons[pos])
         
         # Generate flight path
-        flight_points = generate_flight_path(
-            dep_airport, arr_airport, start_time, duration_seconds, points_per_flight
-        )
-        
-        # Add callsign to each point
-        for point in flight_points:
-            point['callsign'] = str(callsign).strip()
-            all_flight_points.append(point)
+        path = flight_path_arrays(dep_coords, arr_coords, start_times[pos], durations_seconds[pos],
+                                  points_per_flight, rng)
+        end = offset + points_per_flight
+        for name, values in path.items():
+            point_columns[name][offset:end] = values
+        offset = end
         
         flights_processed += 1
         
         if (idx + 1) % 1000 == 0:
             print(f"Processed {idx + 1} flights...")
     
+    # Callsigns: cleaned once per flight (str() + strip, vectorized), then
+    # repeated across that flight's points
+    callsigns = df.get(callsign_col)
+    if callsigns is None:
+        callsigns = [f'FLIGHT{idx}' for idx in df.index]
+    callsigns = np.char.strip(np.asarray(callsigns, dtype=str)).astype(object)
+    point_columns['callsign'] = np.repeat(callsigns[has_coords], max(points_per_flight, 0))
+    
     # Create DataFrame
-    if not all_flight_points:
+    if offset == 0:
         raise ValueError("No valid flight routes generated. Check airport codes.")
     
-    result_df = pd.DataFrame(all_flight_points)
+    point_columns['time'] = format_iso_times(point_columns['time'])
+    result_df = pd.DataFrame(point_columns)
     
     # Save to CSV
     output_path = Path(output_csv)
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    result_df.to_csv(output_path, index=False)
+    write_csv(result_df, output_path)
     
     print(f"\nGenerated {len(result_df)} flight position points from {flights_processed} flights")
     print(f"Skipped {flights_skipped} flights (missing airports or coordinates)")
@@ -312,9 +405,10 @@ if __name__ == '__main__':
     parser.add_argument('--input', required=True, help='Input CSV with airport codes')
     parser.add_argument('--output', default='data/flight_routes.csv', help='Output CSV with flight positions')
     parser.add_argument('--points', type=int, default=8, help='Number of position points per flight')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible paths')
     
     args = parser.parse_args()
     
-    generate_routes_from_csv(args.input, args.output, args.points)
+    generate_routes_from_csv(args.input, args.output, args.points, args.seed)
 
 
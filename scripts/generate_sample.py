@@ -18,75 +18,72 @@ def generate_sample_flights(num_flights=300, duration_hours=2, output_file='data
     
     Creates flights along SFO → LAX corridor with realistic headings and timestamps.
     """
-    np.random.seed(42)  # For reproducibility
+    rng = np.random.default_rng(42)  # For reproducibility
     
     # SFO → LAX corridor coordinates
     sfo_lat, sfo_lon = 37.6213, -122.3790
     lax_lat, lax_lon = 33.9425, -118.4081
     
-    # Generate flights
-    flights = []
+    # Generate flights (all random draws for the corridor flights at once)
     start_time = datetime.now() - timedelta(hours=duration_hours)
     
-    for i in range(num_flights):
-        # Random position along corridor
-        progress = np.random.uniform(0, 1)
-        lat = sfo_lat + (lax_lat - sfo_lat) * progress + np.random.normal(0, 0.5)
-        lon = sfo_lon + (lax_lon - sfo_lon) * progress + np.random.normal(0, 0.5)
-        
-        # Heading roughly southeast (SFO → LAX)
-        base_heading = 135  # Southeast
-        heading = base_heading + np.random.normal(0, 15)
-        heading = heading % 360
-        
-        # Random timestamp within duration
-        time_offset = np.random.uniform(0, duration_hours * 3600)
-        timestamp = start_time + timedelta(seconds=time_offset)
-        
-        # Random altitude (flattened for 2D demo, but keep for realism)
-        altitude = np.random.uniform(30000, 40000)
-        
-        # Callsign
-        callsign = f"DEMO{1000 + i}"
-        
-        flights.append({
-            'time': timestamp.isoformat(),
-            'latitude': lat,
-            'longitude': lon,
-            'heading': heading,
-            'altitude': altitude,
-            'callsign': callsign,
-            'speed': np.random.uniform(450, 550)  # knots
-        })
+    # Random position along corridor
+    progress = rng.uniform(0, 1, num_flights)
+    position_noise = rng.normal(0, 0.5, (2, num_flights))
+    lats = sfo_lat + (lax_lat - sfo_lat) * progress + position_noise[0]
+    lons = sfo_lon + (lax_lon - sfo_lon) * progress + position_noise[1]
+    
+    # Heading roughly southeast (SFO → LAX)
+    base_heading = 135  # Southeast
+    headings = (base_heading + rng.normal(0, 15, num_flights)) % 360
+    
+    # Random timestamp within duration
+    time_offsets = rng.uniform(0, duration_hours * 3600, num_flights)
+    times = np.datetime64(start_time, 'us') + np.round(time_offsets * 1e6).astype('timedelta64[us]')
+    
+    # Random altitude (flattened for 2D demo, but keep for realism)
+    altitudes = rng.uniform(30000, 40000, num_flights)
+    speeds = rng.uniform(450, 550, num_flights)  # knots
+    
+    # Callsign
+    callsigns = [f"DEMO{1000 + i}" for i in range(num_flights)]
+    
+    flights = {
+        'time': list(times),
+        'latitude': lats.tolist(),
+        'longitude': lons.tolist(),
+        'heading': headings.tolist(),
+        'altitude': altitudes.tolist(),
+        'callsign': callsigns,
+        'speed': speeds.tolist(),
+    }
     
     # Add some formation clusters (flights close together with similar headings)
     num_clusters = num_flights // 20
     for _ in range(num_clusters):
         # Pick a random flight as cluster center
-        center_idx = np.random.randint(0, len(flights))
-        center = flights[center_idx]
+        center_idx = rng.integers(0, len(flights['time']))
         
         # Add 2-4 nearby flights with similar headings
-        cluster_size = np.random.randint(2, 5)
+        cluster_size = rng.integers(2, 5)
+        # Plain Python floats/ints, so the per-flight arithmetic below stays scalar
+        noise = (rng.normal(0, 1, (cluster_size, 5)) * np.array([0.05, 0.05, 5, 1000, 20])).tolist()
+        minute_offsets = rng.integers(-2, 2, cluster_size).tolist()
         for j in range(cluster_size):
-            lat = center['latitude'] + np.random.normal(0, 0.05)
-            lon = center['longitude'] + np.random.normal(0, 0.05)
-            heading = center['heading'] + np.random.normal(0, 5)
-            heading = heading % 360
-            
-            timestamp = pd.to_datetime(center['time']) + timedelta(minutes=np.random.randint(-2, 2))
-            
-            flights.append({
-                'time': timestamp.isoformat(),
-                'latitude': lat,
-                'longitude': lon,
-                'heading': heading,
-                'altitude': center['altitude'] + np.random.normal(0, 1000),
-                'callsign': f"DEMO{2000 + len(flights)}",
-                'speed': center['speed'] + np.random.normal(0, 20)
-            })
-    
-    # Create DataFrame
+            flights['time'].append(flights['time'][center_idx] + np.timedelta64(minute_offsets[j], 'm'))
+            flights['latitude'].append(flights['latitude'][center_idx] + noise[j][0])
+            flights['longitude'].append(flights['longitude'][center_idx] + noise[j][1])
+            flights['heading'].append((flights['heading'][center_idx] + noise[j][2]) % 360)
+            flights['altitude'].append(flights['altitude'][center_idx] + noise[j][3])
+            flights['callsign'].append(f"DEMO{2000 + len(flights['callsign'])}")
+            flights['speed'].append(flights['speed'][center_idx] + noise[j][4])
+    
+    # Create DataFrame (ISO times, microseconds only when non-zero like isoformat())
+    times = np.array(flights['time'], dtype='datetime64[us]')
+    has_micros = times.astype(np.int64) % 1_000_000 != 0
+    flights['time'] = np.where(has_micros,
+                               np.datetime_as_string(times, unit='us'),
+                               np.datetime_as_string(times, unit='s'))
     df = pd.DataFrame(flights)
     
     # Save to CSV
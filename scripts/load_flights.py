@@ -1,7 +1,23 @@
+import math
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
 import numpy as np
-import math
+
+# Try to import numba to JIT-compile the node interpolation, but make it optional
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# Try to import pyarrow for its streaming CSV/Parquet writers, but make it optional
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
 
 # Load the CSV file
 print("Loading flights CSV...")
@@ -16,33 +32,26 @@ print(df.head())
 # Times are in format like 517.0 (5:17 AM), 1400.0 (2:00 PM), etc.
 # We'll use a base date of 2013-01-01 and add time to it
 
-def convert_time_to_datetime(time_value, base_date):
-    """Convert numeric time (e.g., 517.0 or 517) to datetime object
+def convert_time_to_datetime(time_values, base_date):
+    """Convert a Series of numeric times (e.g., 517.0 or 517) to datetimes
     Times are in HHMM format: 517 = 5:17 AM, 830 = 8:30 AM, 1400 = 2:00 PM
+    Missing values become NaT (NaN propagates through the arithmetic, so no mask
+    or per-row work is needed).
     """
-    if pd.isna(time_value):
-        return pd.NaT
-    
-    # Convert to integer to remove decimal (handles both int and float)
-    time_int = int(float(time_value))
-    
-    # Extract hours and minutes from HHMM format
-    hours = time_int // 100
-    minutes = time_int % 100
+    # Truncate to a whole HHMM value (handles both int and float)
+    time_int = np.trunc(time_values.to_numpy(dtype=np.float64))
     
-    # Handle cases where minutes >= 60 (shouldn't happen in valid data, but safety check)
-    if minutes >= 60:
-        hours += minutes // 60
-        minutes = minutes % 60
+    # Extract hours and minutes from HHMM format, carrying minutes >= 60 into
+    # the hours (shouldn't happen in valid data, but safety check)
+    hours = time_int // 100 + (time_int % 100) // 60
+    minutes = (time_int % 100) % 60
     
     # Handle times that go past midnight (hours >= 24)
     # Since we're treating everything as single day, cap at 23:59
-    if hours >= 24:
-        hours = 23
-        minutes = 59
+    minutes_of_day = np.where(hours >= 24, 23 * 60 + 59, hours * 60 + minutes)
     
     # Create datetime by adding time to base date
-    return base_date + timedelta(hours=hours, minutes=minutes)
+    return pd.Series(base_date + pd.to_timedelta(minutes_of_day, unit='m'), index=time_values.index)
 
 # Set base date (treating all flights as if they're on this day)
 base_date = datetime(2013, 1, 1)
@@ -50,16 +59,16 @@ base_date = datetime(2013, 1, 1)
 print("\nConverting time columns to datetime objects...")
 
 # Convert dep_time
-df['dep_time_dt'] = df['dep_time'].apply(lambda x: convert_time_to_datetime(x, base_date))
+df['dep_time_dt'] = convert_time_to_datetime(df['dep_time'], base_date)
 
 # Convert sched_dep_time
-df['sched_dep_time_dt'] = df['sched_dep_time'].apply(lambda x: convert_time_to_datetime(x, base_date))
+df['sched_dep_time_dt'] = convert_time_to_datetime(df['sched_dep_time'], base_date)
 
 # Convert arr_time
-df['arr_time_dt'] = df['arr_time'].apply(lambda x: convert_time_to_datetime(x, base_date))
+df['arr_time_dt'] = convert_time_to_datetime(df['arr_time'], base_date)
 
 # Convert sched_arr_time
-df['sched_arr_time_dt'] = df['sched_arr_time'].apply(lambda x: convert_time_to_datetime(x, base_date))
+df['sched_arr_time_dt'] = convert_time_to_datetime(df['sched_arr_time'], base_date)
 
 # Parse time_hour if it exists (already a datetime string)
 if 'time_hour' in df.columns:
@@ -67,11 +76,9 @@ if 'time_hour' in df.columns:
 
 # Create a combined datetime from year, month, day, hour, minute (but all on same day)
 # Since we're treating as single day, we'll just use hour and minute with base_date
-df['datetime_from_hour_min'] = df.apply(
-    lambda row: base_date + timedelta(hours=int(row['hour']), minutes=int(row['minute'])) 
-    if pd.notna(row['hour']) and pd.notna(row['minute']) 
-    else pd.NaT, 
-    axis=1
+df['datetime_from_hour_min'] = base_date + pd.to_timedelta(
+    np.trunc(df['hour'].to_numpy(dtype=np.float64)) * 60 + np.trunc(df['minute'].to_numpy(dtype=np.float64)),
+    unit='m'
 )
 
 print("\nTime conversion complete!")
@@ -145,9 +152,15 @@ print("\n" + "="*60)
 print("STEP 3: Synthesize Flight Positions")
 print("="*60)
 
+# Nodes per NumPy interpolation block (128 KB per float64 temporary, so a
+# block's working set stays cache-resident instead of streaming from DRAM)
+INTERPOLATION_BLOCK_SIZE = 16384
+
 def great_circle_interpolate(lat1, lon1, lat2, lon2, fraction):
     """
     Interpolate between two points on a sphere using great circle interpolation.
+    Vectorized: every argument may be a scalar or a NumPy array (broadcast together),
+    so a whole flight's (or many flights') positions come from one call.
     
     Args:
         lat1, lon1: Origin coordinates (degrees)
@@ -155,244 +168,292 @@ def great_circle_interpolate(lat1, lon1, lat2, lon2, fraction):
         fraction: Interpolation fraction (0.0 = origin, 1.0 = destination)
     
     Returns:
-        (lat, lon) tuple of interpolated coordinates
+        (lat, lon) tuple of interpolated coordinates (NaN where any input is NaN)
     """
-    if pd.isna(lat1) or pd.isna(lon1) or pd.isna(lat2) or pd.isna(lon2):
-        return (np.nan, np.nan)
+    lat1, lon1, lat2, lon2, fraction = np.broadcast_arrays(
+        *(np.asarray(v, dtype=np.float64) for v in (lat1, lon1, lat2, lon2, fraction))
+    )
     
     # Convert to radians
-    phi1 = math.radians(lat1)
-    lambda1 = math.radians(lon1)
-    phi2 = math.radians(lat2)
-    lambda2 = math.radians(lon2)
-    
-    # Calculate angular distance
-    d = math.acos(
-        math.sin(phi1) * math.sin(phi2) + 
-        math.cos(phi1) * math.cos(phi2) * math.cos(lambda2 - lambda1)
-    )
+    phi1 = np.radians(lat1)
+    lambda1 = np.radians(lon1)
+    phi2 = np.radians(lat2)
+    lambda2 = np.radians(lon2)
     
-    # Handle co-located points or very close points
-    if d < 1e-10:
-        return (lat1, lon1)
+    # Calculate angular distance (haversine form: stays accurate for nearby
+    # points, where acos of a cosine close to 1 loses most of its digits)
+    h = (np.sin((phi2 - phi1) / 2)**2 +
+         np.cos(phi1) * np.cos(phi2) * np.sin((lambda2 - lambda1) / 2)**2)
+    d = 2 * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
     
-    # Interpolate
-    a = math.sin((1 - fraction) * d) / math.sin(d)
-    b = math.sin(fraction * d) / math.sin(d)
+    # Slerp weights; for co-located or very close points they tend to the
+    # linear weights (1 - f, f), which are used there instead of 0/0
+    close = d < 1e-10
+    sin_d = np.where(close, 1.0, np.sin(d))
+    a = np.where(close, 1 - fraction, np.sin((1 - fraction) * d) / sin_d)
+    b = np.where(close, fraction, np.sin(fraction * d) / sin_d)
     
-    x = a * math.cos(phi1) * math.cos(lambda1) + b * math.cos(phi2) * math.cos(lambda2)
-    y = a * math.cos(phi1) * math.sin(lambda1) + b * math.cos(phi2) * math.sin(lambda2)
-    z = a * math.sin(phi1) + b * math.sin(phi2)
+    x = a * np.cos(phi1) * np.cos(lambda1) + b * np.cos(phi2) * np.cos(lambda2)
+    y = a * np.cos(phi1) * np.sin(lambda1) + b * np.cos(phi2) * np.sin(lambda2)
+    z = a * np.sin(phi1) + b * np.sin(phi2)
     
-    phi = math.atan2(z, math.sqrt(x*x + y*y))
-    lambda_interp = math.atan2(y, x)
+    phi = np.arctan2(z, np.sqrt(x*x + y*y))
+    lambda_interp = np.arctan2(y, x)
     
     # Convert back to degrees
-    return (math.degrees(phi), math.degrees(lambda_interp))
-
-def generate_flight_nodes(row, time_step_minutes=20):
+    lat = np.degrees(phi)
+    lon = np.degrees(lambda_interp)
+    if lat.ndim == 0:
+        return (float(lat), float(lon))
+    return (lat, lon)
+
+if HAS_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def great_circle_interpolate_nodes(lat1, lon1, lat2, lon2, fraction):
+        """
+        Per-node great_circle_interpolate over equal-length arrays, compiled with
+        numba and spread over cores (no NaN inputs: callers pass valid flights only).
+        """
+        rad = math.pi / 180
+        out_lat = np.empty(len(fraction))
+        out_lon = np.empty(len(fraction))
+        for i in prange(len(fraction)):
+            phi1 = lat1[i] * rad
+            lambda1 = lon1[i] * rad
+            phi2 = lat2[i] * rad
+            lambda2 = lon2[i] * rad
+            
+            h = (math.sin((phi2 - phi1) / 2)**2 +
+                 math.cos(phi1) * math.cos(phi2) * math.sin((lambda2 - lambda1) / 2)**2)
+            d = 2 * math.asin(math.sqrt(min(h, 1.0)))
+            
+            # Linear weights for co-located or very close points (slerp limit)
+            if d < 1e-10:
+                a = 1 - fraction[i]
+                b = fraction[i]
+            else:
+                sin_d = math.sin(d)
+                a = math.sin((1 - fraction[i]) * d) / sin_d
+                b = math.sin(fraction[i] * d) / sin_d
+            
+            x = a * math.cos(phi1) * math.cos(lambda1) + b * math.cos(phi2) * math.cos(lambda2)
+            y = a * math.cos(phi1) * math.sin(lambda1) + b * math.cos(phi2) * math.sin(lambda2)
+            z = a * math.sin(phi1) + b * math.sin(phi2)
+            
+            out_lat[i] = math.atan2(z, math.sqrt(x*x + y*y)) / rad
+            out_lon[i] = math.atan2(y, x) / rad
+        return out_lat, out_lon
+else:
+    great_circle_interpolate_nodes = great_circle_interpolate
+
+def generate_flight_nodes(df, time_step_minutes=20):
     """
-    Generate position nodes for a single flight.
+    Generate position nodes for every flight in the dataframe at once.
+    
+    Each flight gets a node every time_step_minutes from departure up to arrival,
+    plus a final node at the arrival time when the last step falls more than a
+    minute short of it. All nodes are built with array ops (np.repeat to tile
+    flight metadata, one great-circle call for every position, numba-compiled
+    when available).
     
     Args:
-        row: Flight row from dataframe
+        df: Flights dataframe with *_dt times and origin/dest coordinates
         time_step_minutes: Time step in minutes (default: 20)
     
     Returns:
-        List of dictionaries, each representing a node
+        DataFrame with one row per node, ordered by flight then time_index
     """
-    nodes = []
+    # Skip flights missing required data
+    valid = (df['dep_time_dt'].notna() & df['arr_time_dt'].notna() &
+             df['origin_lat'].notna() & df['origin_lon'].notna() &
+             df['dest_lat'].notna() & df['dest_lon'].notna())
+    flights = df[valid]
     
-    # Skip if missing required data
-    if (pd.isna(row['dep_time_dt']) or pd.isna(row['arr_time_dt']) or
-        pd.isna(row['origin_lat']) or pd.isna(row['origin_lon']) or
-        pd.isna(row['dest_lat']) or pd.isna(row['dest_lon'])):
-        return nodes
+    dep_ns = flights['dep_time_dt'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    arr_ns = flights['arr_time_dt'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    duration_ns = arr_ns - dep_ns
     
-    dep_time = row['dep_time_dt']
-    arr_time = row['arr_time_dt']
+    # Skip if duration is negative or zero (invalid flight)
+    keep = duration_ns > 0
+    flights = flights[keep]
+    dep_ns = dep_ns[keep]
+    duration_ns = duration_ns[keep]
     
-    # Calculate flight duration
-    duration = arr_time - dep_time
+    # Regular steps at dep + k * step for every k with dep + k * step <= arr,
+    # then the arrival itself if the last step is more than 1 minute before it
+    step_ns = np.int64(time_step_minutes * 60 * 10**9)
+    n_steps = duration_ns // step_ns + 1
+    has_final = duration_ns - (n_steps - 1) * step_ns > 60 * 10**9
+    n_nodes = n_steps + has_final
     
-    # Skip if duration is negative or zero (invalid flight)
-    if duration.total_seconds() <= 0:
-        return nodes
+    flight_idx = np.repeat(np.arange(len(flights)), n_nodes)
+    starts = np.cumsum(n_nodes) - n_nodes
+    time_index = np.arange(len(flight_idx)) - starts[flight_idx]
+    is_final = has_final[flight_idx] & (time_index == n_steps[flight_idx])
     
-    # Generate time steps (every time_step_minutes minutes)
-    current_time = dep_time
-    time_index = 0
+    node_duration_ns = duration_ns[flight_idx]
+    elapsed_ns = np.where(is_final, node_duration_ns, time_index * step_ns)
+    fractions = np.clip(elapsed_ns / node_duration_ns, 0.0, 1.0)
     
-    while current_time <= arr_time:
-        # Calculate interpolation fraction
-        elapsed = (current_time - dep_time).total_seconds()
-        total_duration = duration.total_seconds()
-        fraction = elapsed / total_duration if total_duration > 0 else 0.0
-        
-        # Clamp fraction to [0, 1]
-        fraction = max(0.0, min(1.0, fraction))
-        
-        # Interpolate position
-        lat, lon = great_circle_interpolate(
-            row['origin_lat'], row['origin_lon'],
-            row['dest_lat'], row['dest_lon'],
-            fraction
+    # Interpolate in cache-sized blocks of nodes: the NumPy path allocates a
+    # temporary per ufunc, so small blocks keep them (and the gathered
+    # coordinates) in cache. The numba kernel streams, so it takes everything at once.
+    origin_lat = flights['origin_lat'].to_numpy(dtype=np.float64)
+    origin_lon = flights['origin_lon'].to_numpy(dtype=np.float64)
+    dest_lat = flights['dest_lat'].to_numpy(dtype=np.float64)
+    dest_lon = flights['dest_lon'].to_numpy(dtype=np.float64)
+    lats = np.empty(len(flight_idx))
+    lons = np.empty(len(flight_idx))
+    block_size = max(len(flight_idx), 1) if HAS_NUMBA else INTERPOLATION_BLOCK_SIZE
+    for start in range(0, len(flight_idx), block_size):
+        block = slice(start, start + block_size)
+        block_flights = flight_idx[block]
+        lats[block], lons[block] = great_circle_interpolate_nodes(
+            origin_lat[block_flights], origin_lon[block_flights],
+            dest_lat[block_flights], dest_lon[block_flights],
+            fractions[block]
         )
-        
-        # Create node
-        node = {
-            'flight_id': row['id'],
-            'timestamp': current_time,
-            'lat': lat,
-            'lon': lon,
-            'time_index': time_index,
-            'carrier': row['carrier'],
-            'tailnum': row['tailnum'] if pd.notna(row['tailnum']) else None,
-            'origin': row['origin'],
-            'dest': row['dest']
-        }
-        nodes.append(node)
-        
-        # Move to next time step
-        current_time += timedelta(minutes=time_step_minutes)
-        time_index += 1
     
-    # Always include the final arrival point if not already included
-    # Check if we need to add the final point (within 1 minute tolerance to avoid duplicates)
-    if nodes:
-        last_time_diff = abs((nodes[-1]['timestamp'] - arr_time).total_seconds())
-        if last_time_diff > 60:  # More than 1 minute difference, add final point
-            lat, lon = great_circle_interpolate(
-                row['origin_lat'], row['origin_lon'],
-                row['dest_lat'], row['dest_lon'],
-                1.0
-            )
-            node = {
-                'flight_id': row['id'],
-                'timestamp': arr_time,
-                'lat': lat,
-                'lon': lon,
-                'time_index': time_index,
-                'carrier': row['carrier'],
-                'tailnum': row['tailnum'] if pd.notna(row['tailnum']) else None,
-                'origin': row['origin'],
-                'dest': row['dest']
-            }
-            nodes.append(node)
-    elif not nodes:
-        # Edge case: if flight duration is very short and we have no nodes yet,
-        # add at least origin and destination
-        lat_orig, lon_orig = great_circle_interpolate(
-            row['origin_lat'], row['origin_lon'],
-            row['dest_lat'], row['dest_lon'],
-            0.0
-        )
-        node_orig = {
-            'flight_id': row['id'],
-            'timestamp': dep_time,
-            'lat': lat_orig,
-            'lon': lon_orig,
-            'time_index': 0,
-            'carrier': row['carrier'],
-            'tailnum': row['tailnum'] if pd.notna(row['tailnum']) else None,
-            'origin': row['origin'],
-            'dest': row['dest']
-        }
-        nodes.append(node_orig)
-        
-        lat_dest, lon_dest = great_circle_interpolate(
-            row['origin_lat'], row['origin_lon'],
-            row['dest_lat'], row['dest_lon'],
-            1.0
-        )
-        node_dest = {
-            'flight_id': row['id'],
-            'timestamp': arr_time,
-            'lat': lat_dest,
-            'lon': lon_dest,
-            'time_index': 1,
-            'carrier': row['carrier'],
-            'tailnum': row['tailnum'] if pd.notna(row['tailnum']) else None,
-            'origin': row['origin'],
-            'dest': row['dest']
-        }
-        nodes.append(node_dest)
+    return pd.DataFrame({
+        'flight_id': flights['id'].to_numpy()[flight_idx],
+        # Times are whole minutes, so second resolution is lossless (and keeps
+        # the CSV timestamps as 'YYYY-MM-DD HH:MM:SS' with either writer)
+        'timestamp': (dep_ns[flight_idx] + elapsed_ns).view('datetime64[ns]').astype('datetime64[s]'),
+        'lat': lats,
+        'lon': lons,
+        'time_index': time_index,
+        'carrier': flights['carrier'].to_numpy()[flight_idx],
+        'tailnum': flights['tailnum'].to_numpy()[flight_idx],
+        'origin': flights['origin'].to_numpy()[flight_idx],
+        'dest': flights['dest'].to_numpy()[flight_idx],
+    })
+
+# Node file layout (pyarrow writers need the schema up front)
+node_columns = ['flight_id', 'timestamp', 'lat', 'lon', 'time_index', 'carrier', 'tailnum', 'origin', 'dest']
+if HAS_PYARROW:
+    NODE_SCHEMA = pa.schema([
+        ('flight_id', pa.int64()),
+        ('timestamp', pa.timestamp('s')),
+        ('lat', pa.float64()),
+        ('lon', pa.float64()),
+        ('time_index', pa.int64()),
+        ('carrier', pa.string()),
+        ('tailnum', pa.string()),
+        ('origin', pa.string()),
+        ('dest', pa.string()),
+    ])
+
+class NodeWriter:
+    """
+    Open-once writer for batches of flight nodes.
+    
+    With pyarrow, batches stream through a pyarrow.csv.CSVWriter and a zstd
+    ParquetWriter (the columnar copy for fast, dtype-preserving loading later;
+    the CSV stays the input of load_mongodb.py). Without it, batches are
+    appended with to_csv to a single open file handle.
+    """
+    
+    def __init__(self, csv_path, parquet_path):
+        if HAS_PYARROW:
+            self.csv_writer = pa_csv.CSVWriter(csv_path, NODE_SCHEMA)
+            self.parquet_writer = pq.ParquetWriter(parquet_path, NODE_SCHEMA, compression='zstd')
+        else:
+            self.csv_file = open(csv_path, 'w', newline='')
+            self.header = True
+    
+    def write(self, nodes):
+        if HAS_PYARROW:
+            table = pa.Table.from_pandas(nodes[node_columns], schema=NODE_SCHEMA, preserve_index=False)
+            self.csv_writer.write_table(table)
+            self.parquet_writer.write_table(table)
+        else:
+            nodes[node_columns].to_csv(self.csv_file, index=False, header=self.header)
+            self.header = False
     
-    return nodes
+    def close(self):
+        if HAS_PYARROW:
+            self.csv_writer.close()
+            self.parquet_writer.close()
+        else:
+            self.csv_file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
 
 print("\nGenerating flight position nodes (every 20 minutes)...")
-print("This may take a while for large datasets...")
+print(f"  Interpolation kernel: {'numba' if HAS_NUMBA else 'numpy'}")
 
-# Generate nodes for all flights and save incrementally to avoid memory issues
+# Generate nodes for all flights and stream them out in batches to bound memory
 total_flights = len(df)
-processed = 0
-batch_size = 5000  # Process in batches
-batch_nodes = []
+batch_size = 5000  # Flights per batch
 total_nodes = 0
 output_file = 'data/flight_nodes.csv'
+parquet_file = 'data/flight_nodes.parquet'
 
-# Open output file and write header
-node_columns = ['flight_id', 'timestamp', 'lat', 'lon', 'time_index', 'carrier', 'tailnum', 'origin', 'dest']
-first_batch = True
+# Running statistics (so the written file never has to be re-read)
+batch_nodes_per_flight = []
+batch_time_min = []
+batch_time_max = []
+# Without pyarrow there is no Parquet copy; keep the batches for the pickle fallback
+pickle_batches = []
 
 print(f"Processing {total_flights} flights in batches of {batch_size}...")
 
-for idx, row in df.iterrows():
-    nodes = generate_flight_nodes(row, time_step_minutes=20)
-    batch_nodes.extend(nodes)
-    processed += 1
-    
-    # Save batch when it reaches batch_size
-    if len(batch_nodes) >= batch_size or processed == total_flights:
-        if batch_nodes:
-            batch_df = pd.DataFrame(batch_nodes)
-            # Write to CSV (append mode after first write)
-            if first_batch:
-                batch_df.to_csv(output_file, index=False, mode='w')
-                first_batch = False
-            else:
-                batch_df.to_csv(output_file, index=False, mode='a', header=False)
-            total_nodes += len(batch_nodes)
-            batch_nodes = []  # Clear batch to free memory
-    
-    # Progress update every 10000 flights
-    if processed % 10000 == 0:
-        print(f"  Processed {processed}/{total_flights} flights... ({total_nodes:,} nodes written so far)")
+with NodeWriter(output_file, parquet_file) as writer:
+    for start in range(0, total_flights, batch_size):
+        batch_nodes = generate_flight_nodes(df.iloc[start:start + batch_size], time_step_minutes=20)
+        writer.write(batch_nodes)
+        
+        total_nodes += len(batch_nodes)
+        batch_nodes_per_flight.append(batch_nodes['flight_id'].value_counts())
+        batch_time_min.append(batch_nodes['timestamp'].min())
+        batch_time_max.append(batch_nodes['timestamp'].max())
+        if not HAS_PYARROW:
+            pickle_batches.append(batch_nodes)
+        
+        # Progress update every 10000 flights
+        processed = min(start + batch_size, total_flights)
+        if processed % 10000 == 0:
+            print(f"  Processed {processed}/{total_flights} flights... ({total_nodes:,} nodes written so far)")
 
 print(f"\nCompleted processing {total_flights} flights")
 print(f"Generated {total_nodes:,} total nodes")
 print(f"Saved to: {output_file}")
+if HAS_PYARROW:
+    print(f"Saved Parquet copy to: {parquet_file}")
 
 # Load a sample to show
 print("\nLoading sample from saved file...")
-nodes_df = pd.read_csv(output_file, nrows=1000)  # Load first 1000 rows as sample
+sample_df = pd.read_csv(output_file, nrows=1000)  # Load first 1000 rows as sample
 
-print(f"\nNodes DataFrame shape: {nodes_df.shape} (showing first 1000 rows)")
-print(f"Columns: {list(nodes_df.columns)}")
+print(f"\nNodes DataFrame shape: {sample_df.shape} (showing first 1000 rows)")
+print(f"Columns: {list(sample_df.columns)}")
 
 print("\nSample nodes:")
-print(nodes_df.head(10))
+print(sample_df.head(10))
 
-# Show statistics from the saved file
-print("\nCalculating statistics from saved file...")
-nodes_df_full = pd.read_csv(output_file)
-nodes_df_full['timestamp'] = pd.to_datetime(nodes_df_full['timestamp'])
+# Show statistics from the running counters
+print("\nCalculating statistics...")
+nodes_per_flight = pd.concat(batch_nodes_per_flight).groupby(level=0).sum()
 
 print("\nNode statistics:")
-print(f"  Total nodes: {len(nodes_df_full):,}")
-print(f"  Unique flights: {nodes_df_full['flight_id'].nunique():,}")
-print(f"  Average nodes per flight: {len(nodes_df_full) / nodes_df_full['flight_id'].nunique():.2f}")
-print(f"  Min nodes per flight: {nodes_df_full.groupby('flight_id').size().min()}")
-print(f"  Max nodes per flight: {nodes_df_full.groupby('flight_id').size().max()}")
-print(f"  Time range: {nodes_df_full['timestamp'].min()} to {nodes_df_full['timestamp'].max()}")
-
-# Also save as pickle for faster loading later
-pickle_file = 'data/flight_nodes.pkl'
-print(f"\nSaving to pickle format for faster loading: {pickle_file}")
-nodes_df_full.to_pickle(pickle_file)
+print(f"  Total nodes: {total_nodes:,}")
+print(f"  Unique flights: {len(nodes_per_flight):,}")
+print(f"  Average nodes per flight: {total_nodes / len(nodes_per_flight):.2f}")
+print(f"  Min nodes per flight: {nodes_per_flight.min()}")
+print(f"  Max nodes per flight: {nodes_per_flight.max()}")
+print(f"  Time range: {pd.Series(batch_time_min).min()} to {pd.Series(batch_time_max).max()}")
+
+# Without pyarrow, fall back to a pickle for faster loading later
+if not HAS_PYARROW:
+    pickle_file = 'data/flight_nodes.pkl'
+    print(f"\nSaving to pickle format for faster loading: {pickle_file}")
+    pd.concat(pickle_batches, ignore_index=True).to_pickle(pickle_file)
 print("Done!")
 
 print("\n" + "="*60)
 print("STEP 3 Complete!")
 print("="*60)
-
@@ -1,10 +1,19 @@
 import json
 import pymongo
-from pymongo import MongoClient, GEOSPHERE
+import bson
+from bson.raw_bson import RawBSONDocument
+from pymongo import MongoClient, GEOSPHERE, ASCENDING, IndexModel, InsertOne
 from datetime import datetime
 import os
+import mmap
+import glob
+import multiprocessing
 import sys
 import time
+from typing import Any, Optional
+from itertools import chain, islice
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 # Try to import tqdm for progress bar, but make it optional
 try:
@@ -16,6 +25,403 @@ except ImportError:
     def tqdm(iterable, **kwargs):
         return iterable
 
+# Try to import ijson for streaming large JSON files, fall back to json.load
+try:
+    import ijson
+    HAS_IJSON = True
+except ImportError:
+    HAS_IJSON = False
+
+# Try to import orjson for faster whole-file parsing, fall back to json
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# Try to import msgspec to decode GeoJSON features into typed structs
+try:
+    import msgspec
+    HAS_MSGSPEC = True
+
+    class Feature(msgspec.Struct):
+        """A GeoJSON feature decoded directly into a slotted struct."""
+        type: str
+        geometry: Optional[dict] = None
+        properties: Optional[dict] = None
+except ImportError:
+    HAS_MSGSPEC = False
+    Feature = None
+
+# Number of batch writes kept in flight while the next batch is built
+INSERT_WORKERS = 4
+
+# Documents per bulk write. Throughput for small documents like these levels
+# off at around a thousand per batch; larger batches only add latency and
+# memory per in-flight write. Override with HEATMAP_BATCH_SIZE.
+BATCH_SIZE = int(os.getenv('HEATMAP_BATCH_SIZE', '1000'))
+
+# Connection pool per shard worker process when loading data/heatmap.part*.ndjson
+SHARD_MAX_POOL_SIZE = 50
+
+# MongoDB's BSON document size limit, used to sanity-check the batch size
+MAX_BSON_SIZE = 16 * 1024 * 1024
+
+
+def decode_mapped(path, decode):
+    """
+    Run decode() over a read-only memory map of the file at path.
+
+    Avoids copying the whole file into a bytes object before parsing, so the
+    page cache backs the input instead of the Python heap.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return decode(b'')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                return decode(view)
+            finally:
+                # The map cannot close while a view of it is still exported
+                view.release()
+
+
+def ndjson_header(path):
+    """Decode the header line of an NDJSON file ({} if the file is empty)."""
+    loads = orjson.loads if HAS_ORJSON else json.loads
+    with open(path, 'rb') as f:
+        first_line = f.readline()
+    return loads(first_line) if first_line.strip() else {}
+
+
+def complete_shard_set(shard_files):
+    """
+    Pick the shards written by one convert_heatmap_to_ndjson.py --shards run.
+
+    Each shard header records its index and the shard count, so leftovers
+    of an earlier run with more shards (or written before headers carried
+    them) are left out. Returns the shard paths in index order, or [] if no
+    run's set is complete.
+    """
+    by_count = defaultdict(dict)
+    for path in shard_files:
+        header = ndjson_header(path)
+        by_count[header.get('shards')][header.get('shard')] = path
+    for count, paths in by_count.items():
+        if isinstance(count, int) and set(paths) == set(range(count)):
+            return [paths[i] for i in range(count)]
+    return []
+
+
+def open_json_stream(path, items_key, header_keys=('metadata',), item_type=None):
+    """
+    Open a heatmap JSON file for streaming.
+
+    Returns (header, items): header maps each of header_keys to its top-level
+    value (None if missing) and items yields the elements of the top-level
+    items_key array one at a time. With ijson only one element is held in
+    memory at a time; without it the whole file is parsed at once with
+    orjson from a memory map (or json.load).
+
+    Files ending in .ndjson (see convert_heatmap_to_ndjson.py) are read line
+    by line instead: the first line holds the header fields and each further
+    line is one item.
+
+    If item_type is a msgspec Struct (and msgspec is installed), NDJSON lines,
+    or the whole file when ijson is unavailable, are decoded straight into
+    item_type instances rather than dicts.
+    """
+    loads = orjson.loads if HAS_ORJSON else json.loads
+    use_struct = HAS_MSGSPEC and item_type is not None
+
+    if path.endswith('.ndjson'):
+        load_item = msgspec.json.Decoder(item_type).decode if use_struct else loads
+        first = ndjson_header(path)
+        header = {key: first.get(key) for key in header_keys}
+
+        def lines():
+            with open(path, 'rb') as f:
+                f.readline()
+                for line in f:
+                    if line.strip():
+                        yield load_item(line)
+
+        return header, lines()
+
+    if not HAS_IJSON and use_struct:
+        # Decode only the fields we use; everything else in the file is skipped
+        document_type = msgspec.defstruct(
+            'Document',
+            [(items_key, list[item_type], [])] + [(key, Any, None) for key in header_keys]
+        )
+        data = decode_mapped(path, lambda buf: msgspec.json.decode(buf, type=document_type))
+        return {key: getattr(data, key) for key in header_keys}, iter(getattr(data, items_key))
+
+    if not HAS_IJSON:
+        if HAS_ORJSON:
+            data = decode_mapped(path, orjson.loads)
+        else:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        return {key: data.get(key) for key in header_keys}, iter(data.get(items_key, []))
+
+    header = {}
+    for key in header_keys:
+        # Header fields are written before the items array, so this stops early
+        with open(path, 'rb') as f:
+            header[key] = next(ijson.items(f, key, use_float=True), None)
+
+    def items():
+        with open(path, 'rb') as f:
+            yield from ijson.items(f, f'{items_key}.item', use_float=True)
+
+    return header, items()
+
+
+def build_data_doc(item):
+    """Build the MongoDB document for one heatmap.json data item."""
+    # Keys always written by compute_heatmap.py are subscripted directly;
+    # the formation fields are only present with WEIGHT_BY_FORMATION
+    item_get = item.get
+    return {
+        'type': 'data',
+        'time_bucket': item['time_bucket'],
+        'flight_count': item['flight_count'],
+        'node_count': item['node_count'],
+        'intensity': item['intensity'],
+        'formation_count': item_get('formation_count'),
+        'weighted_intensity': item_get('weighted_intensity'),
+        # Coordinates are only stored as a GeoJSON Point, which serves both
+        # plain lookups and geospatial queries
+        'location': {
+            'type': 'Point',
+            'coordinates': [item['lon'], item['lat']]
+        }
+    }
+
+
+def build_feature_doc(feature):
+    """Build the MongoDB document for one GeoJSON feature of any shape."""
+    geometry = feature.get('geometry', {})
+    
+    # Store the entire feature structure
+    doc = {
+        'type': 'geojson_feature',
+        'feature_type': feature.get('type'),
+        'geometry': feature.get('geometry'),
+        'properties': feature.get('properties'),
+        'time_bucket': feature.get('properties', {}).get('time_bucket')
+    }
+    
+    # Add location field for geospatial queries if it's a Point
+    coords = geometry.get('coordinates', []) if geometry.get('type') == 'Point' else []
+    if len(coords) >= 2:
+        doc['location'] = {
+            'type': 'Point',
+            'coordinates': [coords[0], coords[1]]
+        }
+    
+    return doc
+
+
+def build_heatmap_feature_doc(feature):
+    """Build the document for a feature written by compute_heatmap.py (no fallbacks)."""
+    geometry = feature['geometry']
+    properties = feature['properties']
+    doc = {
+        'type': 'geojson_feature',
+        'feature_type': feature['type'],
+        'geometry': geometry,
+        'properties': properties,
+        'time_bucket': properties['time_bucket']
+    }
+    
+    if geometry['type'] == 'Point':
+        coords = geometry['coordinates']
+        if len(coords) >= 2:
+            doc['location'] = {
+                'type': 'Point',
+                'coordinates': [coords[0], coords[1]]
+            }
+    
+    return doc
+
+
+def build_struct_feature_doc(feature):
+    """Build the document for a feature decoded into a msgspec Feature struct."""
+    geometry = feature.geometry or {}
+    properties = feature.properties or {}
+    doc = {
+        'type': 'geojson_feature',
+        'feature_type': feature.type,
+        'geometry': feature.geometry,
+        'properties': feature.properties,
+        'time_bucket': properties.get('time_bucket')
+    }
+    
+    coords = geometry.get('coordinates', []) if geometry.get('type') == 'Point' else []
+    if len(coords) >= 2:
+        doc['location'] = {
+            'type': 'Point',
+            'coordinates': [coords[0], coords[1]]
+        }
+    
+    return doc
+
+
+def select_feature_builder(first_feature):
+    """
+    Choose the feature document builder once per file from its first feature.
+
+    Files from compute_heatmap.py always carry type, geometry and a
+    properties.time_bucket, so they can use the subscript-only builder; other
+    GeoJSON (e.g. from preprocess.py) goes through build_feature_doc. Features
+    decoded by msgspec use build_struct_feature_doc.
+    """
+    if HAS_MSGSPEC and isinstance(first_feature, Feature):
+        return build_struct_feature_doc
+    geometry = first_feature.get('geometry')
+    properties = first_feature.get('properties')
+    if ('type' in first_feature
+            and isinstance(geometry, dict) and 'type' in geometry and 'coordinates' in geometry
+            and isinstance(properties, dict) and 'time_bucket' in properties):
+        return build_heatmap_feature_doc
+    return build_feature_doc
+
+
+def count_by_type(collection):
+    """Count documents per 'type' in one aggregation round-trip."""
+    # Sorting on type lets the server answer from the type index without
+    # fetching the documents themselves
+    pipeline = [
+        {'$sort': {'type': 1}},
+        {'$group': {'_id': '$type', 'n': {'$sum': 1}}}
+    ]
+    return {group['_id']: group['n'] for group in collection.aggregate(pipeline)}
+
+
+def write_batch(collection, batch):
+    """Write one batch of documents as an unordered bulk write."""
+    # The script controls the schema, so server-side validation can be skipped
+    return collection.bulk_write(
+        [InsertOne(doc) for doc in batch],
+        ordered=False,
+        bypass_document_validation=True
+    )
+
+
+def insert_in_batches(collection, items, build_doc, batch_size, start_time, unit='documents'):
+    """
+    Build documents from items and insert them batch_size at a time.
+
+    Writes run on a small thread pool so the next batch is parsed and built
+    while earlier ones are in flight; at most INSERT_WORKERS batches are
+    pending at once. A failed batch is reported and skipped. Returns the
+    number of documents inserted.
+    """
+    items = iter(items)
+    encode = bson.encode
+    pending = deque()
+    size_checked = False
+    total_inserted = 0
+
+    # The item count is unknown while streaming, so tqdm shows a running
+    # count and throughput, refreshed on its own interval
+    pbar = tqdm(desc=f"  Inserting {unit}", unit=' docs', smoothing=0.1) if HAS_TQDM else None
+
+    def collect(future, size):
+        nonlocal total_inserted
+        try:
+            future.result()
+        except Exception as e:
+            print(f"\nWarning: Error inserting batch: {e}")
+            return
+        total_inserted += size
+        if pbar is not None:
+            pbar.update(size)
+        elif total_inserted % 50000 == 0:
+            elapsed = time.time() - start_time
+            rate = total_inserted / elapsed if elapsed > 0 else 0
+            print(f"  Inserted {total_inserted:,} {unit} ({rate:.0f} docs/sec)")
+
+    try:
+        with ThreadPoolExecutor(max_workers=INSERT_WORKERS) as executor:
+            while True:
+                # Encode each document once here; the driver sends RawBSONDocument
+                # bytes as-is instead of re-walking the dict on the writer thread
+                batch = [RawBSONDocument(encode(build_doc(item))) for item in islice(items, batch_size)]
+                if not batch:
+                    break
+                if not size_checked:
+                    # Estimate from the first document whether a full batch stays under 16 MB
+                    size_checked = True
+                    estimated_bytes = len(batch[0].raw) * batch_size
+                    if estimated_bytes > MAX_BSON_SIZE:
+                        print(f"\nWarning: a batch of {batch_size:,} {unit} is about "
+                              f"{estimated_bytes / 1024 / 1024:.0f} MB of BSON; consider a smaller HEATMAP_BATCH_SIZE")
+                pending.append((executor.submit(write_batch, collection, batch), len(batch)))
+                # Wait for the oldest insert before building more than the pool can take
+                if len(pending) >= INSERT_WORKERS:
+                    collect(*pending.popleft())
+            while pending:
+                collect(*pending.popleft())
+    finally:
+        if pbar is not None:
+            pbar.close()
+
+    return total_inserted
+
+
+def create_client(uri, max_pool_size=200):
+    """Create the bulk-load MongoClient for uri; returns (client, connection_type)."""
+    # Bulk-load write settings: acknowledge from the primary only and skip the
+    # journal wait per batch. This client is only used for the load.
+    bulk_load_options = {
+        'maxPoolSize': max_pool_size,
+        'minPoolSize': min(20, max_pool_size),
+        'w': 1,
+        'journal': False,
+        'retryWrites': False,
+    }
+    if 'localhost' in uri or '127.0.0.1' in uri:
+        return MongoClient(uri, serverSelectionTimeoutMS=3000, **bulk_load_options), "local MongoDB"
+    # Compress batches on the wire; PyMongo skips compressors whose module is missing
+    client = MongoClient(
+        uri, 
+        serverSelectionTimeoutMS=10000,
+        compressors='zstd,snappy,zlib',
+        **bulk_load_options
+    )
+    return client, "MongoDB Atlas"
+
+
+def load_shard(args):
+    """Insert one NDJSON shard of heatmap data; runs in a worker process."""
+    path, uri, db_name, collection_name = args
+    # Each worker opens its own client; a MongoClient must never be shared across fork
+    client, _ = create_client(uri, max_pool_size=SHARD_MAX_POOL_SIZE)
+    try:
+        _, items = open_json_stream(path, 'data')
+        return insert_in_batches(
+            client[db_name][collection_name], items, build_data_doc, BATCH_SIZE, time.time(),
+            unit=f'documents from {os.path.basename(path)}'
+        )
+    finally:
+        client.close()
+
+
+def load_shards(shard_files, uri, db_name, collection_name):
+    """Insert NDJSON shards with one worker process per shard; returns the total inserted."""
+    args = [(path, uri, db_name, collection_name) for path in shard_files]
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        # Spawned workers would re-run this script's top-level code, so load in-process
+        return sum(map(load_shard, args))
+    workers = min(len(args), os.cpu_count() or 1)
+    with multiprocessing.get_context('fork').Pool(workers) as pool:
+        return sum(pool.map(load_shard, args))
+
+
 print("="*60)
 print("Load Heatmap Data to MongoDB")
 print("="*60)
@@ -68,17 +474,7 @@ print(f"Collection: {COLLECTION_NAME}")
 
 try:
     # Connect to MongoDB
-    if 'localhost' in MONGO_URI or '127.0.0.1' in MONGO_URI:
-        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=3000)
-        connection_type = "local MongoDB"
-    else:
-        client = MongoClient(
-            MONGO_URI, 
-            serverSelectionTimeoutMS=10000,
-            maxPoolSize=50,
-            minPoolSize=10
-        )
-        connection_type = "MongoDB Atlas"
+    client, connection_type = create_client(MONGO_URI)
     
     # Test connection
     client.admin.command('ping')
@@ -87,8 +483,8 @@ try:
     db = client[DB_NAME]
     collection = db[COLLECTION_NAME]
     
-    # Check if collection exists and has data
-    existing_count = collection.count_documents({})
+    # Check if collection exists and has data (metadata count, no collection scan)
+    existing_count = collection.estimated_document_count()
     if existing_count > 0:
         response = input(f"\nCollection '{COLLECTION_NAME}' already has {existing_count:,} documents. Clear it? (y/n): ")
         if response.lower() == 'y':
@@ -109,23 +505,40 @@ print("="*60)
 
 heatmap_json_file = 'data/heatmap.json'
 
+# Prefer the newest of the shards, the line-delimited copy (both from
+# convert_heatmap_to_ndjson.py) and heatmap.json itself
+json_mtime = os.path.getmtime(heatmap_json_file) if os.path.exists(heatmap_json_file) else 0
+found_shard_files = glob.glob('data/heatmap.part*.ndjson')
+heatmap_shard_files = complete_shard_set(found_shard_files)
+if len(heatmap_shard_files) < len(found_shard_files):
+    print(f"⚠ Ignoring {len(found_shard_files) - len(heatmap_shard_files)} leftover shard file(s) "
+          f"not in a complete set (rerun convert_heatmap_to_ndjson.py to clean up)")
+shards_mtime = min((os.path.getmtime(path) for path in heatmap_shard_files), default=0)
+heatmap_ndjson_file = 'data/heatmap.ndjson'
+ndjson_mtime = os.path.getmtime(heatmap_ndjson_file) if os.path.exists(heatmap_ndjson_file) else 0
+if heatmap_shard_files and shards_mtime >= max(json_mtime, ndjson_mtime):
+    heatmap_json_file = heatmap_shard_files[0]
+else:
+    heatmap_shard_files = []
+    if os.path.exists(heatmap_ndjson_file) and ndjson_mtime >= json_mtime:
+        heatmap_json_file = heatmap_ndjson_file
+
 if not os.path.exists(heatmap_json_file):
     print(f"✗ Error: File not found: {heatmap_json_file}")
     sys.exit(1)
 
-print(f"Loading {heatmap_json_file}...")
+if heatmap_shard_files:
+    print(f"Loading {len(heatmap_shard_files)} shards: {', '.join(heatmap_shard_files)}...")
+else:
+    print(f"Loading {heatmap_json_file}...")
 start_time = time.time()
 
 try:
-    with open(heatmap_json_file, 'r') as f:
-        heatmap_data = json.load(f)
+    header, data_items = open_json_stream(heatmap_json_file, 'data')
+    metadata = header['metadata'] or {}
     
-    metadata = heatmap_data.get('metadata', {})
-    data_items = heatmap_data.get('data', [])
-    
-    print(f"✓ Loaded JSON file")
+    print(f"✓ Opened JSON file" + (" (streaming)" if HAS_IJSON or heatmap_json_file.endswith('.ndjson') else ""))
     print(f"  Metadata keys: {list(metadata.keys())}")
-    print(f"  Data items: {len(data_items):,}")
     
     # Store metadata as a separate document
     metadata_doc = {
@@ -134,54 +547,14 @@ try:
         'created_at': datetime.utcnow()
     }
     
-    # Prepare data documents for batch insert
-    BATCH_SIZE = 10000
-    data_docs = []
-    total_inserted = 0
-    
-    print(f"\nInserting {len(data_items):,} data items in batches of {BATCH_SIZE:,}...")
-    
-    for i, item in enumerate(data_items):
-        doc = {
-            'type': 'data',
-            'time_bucket': item.get('time_bucket'),
-            'lat': item.get('lat'),
-            'lon': item.get('lon'),
-            'flight_count': item.get('flight_count'),
-            'node_count': item.get('node_count'),
-            'intensity': item.get('intensity'),
-            'formation_count': item.get('formation_count'),
-            'weighted_intensity': item.get('weighted_intensity'),
-            # Create GeoJSON Point for geospatial queries
-            'location': {
-                'type': 'Point',
-                'coordinates': [item.get('lon'), item.get('lat')]
-            }
-        }
-        data_docs.append(doc)
-        
-        # Insert in batches
-        if len(data_docs) >= BATCH_SIZE:
-            try:
-                collection.insert_many(data_docs, ordered=False)
-                total_inserted += len(data_docs)
-                if total_inserted % 50000 == 0:
-                    elapsed = time.time() - start_time
-                    rate = total_inserted / elapsed if elapsed > 0 else 0
-                    print(f"  Inserted {total_inserted:,}/{len(data_items):,} documents ({rate:.0f} docs/sec)")
-                data_docs = []
-            except Exception as e:
-                print(f"\nWarning: Error inserting batch: {e}")
-                data_docs = []
-                continue
-    
-    # Insert remaining documents
-    if data_docs:
-        try:
-            collection.insert_many(data_docs, ordered=False)
-            total_inserted += len(data_docs)
-        except Exception as e:
-            print(f"\nWarning: Error inserting final batch: {e}")
+    # Build and insert data documents in batches
+    if heatmap_shard_files:
+        # Shard headers all carry the same metadata; each worker reads its own items
+        print(f"\nInserting data items from {len(heatmap_shard_files)} shards in parallel, batches of {BATCH_SIZE:,}...")
+        total_inserted = load_shards(heatmap_shard_files, MONGO_URI, DB_NAME, COLLECTION_NAME)
+    else:
+        print(f"\nInserting data items in batches of {BATCH_SIZE:,}...")
+        total_inserted = insert_in_batches(collection, data_items, build_data_doc, BATCH_SIZE, start_time)
     
     # Insert metadata document
     collection.insert_one(metadata_doc)
@@ -206,6 +579,13 @@ print("="*60)
 
 heatmap_geojson_file = 'data/heatmap.geojson'
 
+# Prefer the line-delimited copy from convert_heatmap_to_ndjson.py --items-key features
+# unless it is older than heatmap.geojson
+geojson_mtime = os.path.getmtime(heatmap_geojson_file) if os.path.exists(heatmap_geojson_file) else 0
+heatmap_geojson_ndjson_file = 'data/heatmap.geojson.ndjson'
+if os.path.exists(heatmap_geojson_ndjson_file) and os.path.getmtime(heatmap_geojson_ndjson_file) >= geojson_mtime:
+    heatmap_geojson_file = heatmap_geojson_ndjson_file
+
 if not os.path.exists(heatmap_geojson_file):
     print(f"✗ Warning: File not found: {heatmap_geojson_file}")
     print("  Skipping GeoJSON file...")
@@ -214,20 +594,17 @@ else:
     geojson_start_time = time.time()
     
     try:
-        # For large files, we'll stream the JSON
-        # Since it's a FeatureCollection, we can parse it in chunks if needed
-        # For now, load the whole file (if it fits in memory)
-        print("  Reading GeoJSON file (this may take a while for large files)...")
-        with open(heatmap_geojson_file, 'r') as f:
-            geojson_data = json.load(f)
-        
-        geojson_metadata = geojson_data.get('metadata', {})
-        features = geojson_data.get('features', [])
+        # Stream the FeatureCollection one feature at a time when ijson is available
+        if not HAS_IJSON and not heatmap_geojson_file.endswith('.ndjson'):
+            print("  Reading GeoJSON file (this may take a while for large files)...")
+        geojson_header, features = open_json_stream(
+            heatmap_geojson_file, 'features', header_keys=('type', 'metadata'), item_type=Feature
+        )
+        geojson_metadata = geojson_header['metadata'] or {}
         
-        print(f"✓ Loaded GeoJSON file")
-        print(f"  Type: {geojson_data.get('type')}")
+        print(f"✓ Opened GeoJSON file" + (" (streaming)" if HAS_IJSON or heatmap_geojson_file.endswith('.ndjson') else ""))
+        print(f"  Type: {geojson_header['type']}")
         print(f"  Metadata keys: {list(geojson_metadata.keys())}")
-        print(f"  Features: {len(features):,}")
         
         # Store GeoJSON metadata as a separate document
         geojson_metadata_doc = {
@@ -236,65 +613,16 @@ else:
             'created_at': datetime.utcnow()
         }
         
-        # Prepare feature documents for batch insert
-        BATCH_SIZE = 10000
-        feature_docs = []
-        total_features_inserted = 0
-        
-        print(f"\nInserting {len(features):,} features in batches of {BATCH_SIZE:,}...")
-        
-        for feature in features:
-            # Store the entire feature structure
-            doc = {
-                'type': 'geojson_feature',
-                'feature_type': feature.get('type'),
-                'geometry': feature.get('geometry'),
-                'properties': feature.get('properties'),
-                # Extract coordinates for easier querying
-                'time_bucket': feature.get('properties', {}).get('time_bucket'),
-                'lat': feature.get('properties', {}).get('lat') or (
-                    feature.get('geometry', {}).get('coordinates', [None, None])[1]
-                    if feature.get('geometry', {}).get('type') == 'Point' else None
-                ),
-                'lon': feature.get('properties', {}).get('lon') or (
-                    feature.get('geometry', {}).get('coordinates', [None, None])[0]
-                    if feature.get('geometry', {}).get('type') == 'Point' else None
-                )
-            }
-            
-            # Add location field for geospatial queries if it's a Point
-            if feature.get('geometry', {}).get('type') == 'Point':
-                coords = feature.get('geometry', {}).get('coordinates', [])
-                if len(coords) >= 2:
-                    doc['location'] = {
-                        'type': 'Point',
-                        'coordinates': [coords[0], coords[1]]
-                    }
-            
-            feature_docs.append(doc)
-            
-            # Insert in batches
-            if len(feature_docs) >= BATCH_SIZE:
-                try:
-                    collection.insert_many(feature_docs, ordered=False)
-                    total_features_inserted += len(feature_docs)
-                    if total_features_inserted % 50000 == 0:
-                        elapsed = time.time() - geojson_start_time
-                        rate = total_features_inserted / elapsed if elapsed > 0 else 0
-                        print(f"  Inserted {total_features_inserted:,}/{len(features):,} features ({rate:.0f} docs/sec)")
-                    feature_docs = []
-                except Exception as e:
-                    print(f"\nWarning: Error inserting batch: {e}")
-                    feature_docs = []
-                    continue
-        
-        # Insert remaining features
-        if feature_docs:
-            try:
-                collection.insert_many(feature_docs, ordered=False)
-                total_features_inserted += len(feature_docs)
-            except Exception as e:
-                print(f"\nWarning: Error inserting final batch: {e}")
+        # Build and insert feature documents in batches
+        print(f"\nInserting features in batches of {BATCH_SIZE:,}...")
+        first_feature = next(features, None)
+        if first_feature is None:
+            total_features_inserted = 0
+        else:
+            total_features_inserted = insert_in_batches(
+                collection, chain([first_feature], features), select_feature_builder(first_feature),
+                BATCH_SIZE, geojson_start_time, unit='features'
+            )
         
         # Insert GeoJSON metadata document
         collection.insert_one(geojson_metadata_doc)
@@ -309,7 +637,7 @@ else:
         
     except MemoryError:
         print(f"\n✗ Error: File too large to load into memory")
-        print("  Consider using a streaming JSON parser or splitting the file")
+        print("  Install ijson to stream the file instead of loading it whole")
         sys.exit(1)
     except Exception as e:
         print(f"\n✗ Error loading heatmap.geojson: {e}")
@@ -318,54 +646,27 @@ else:
         # Don't exit, just warn since JSON data was already loaded
         print("\n⚠ Warning: GeoJSON loading failed, but JSON data was successfully loaded")
 
-# Verify insertion
-print("\n" + "="*60)
-print("Verifying insertion...")
-print("="*60)
-
-try:
-    total_count = collection.count_documents({})
-    metadata_count = collection.count_documents({'type': 'metadata'})
-    data_count = collection.count_documents({'type': 'data'})
-    geojson_metadata_count = collection.count_documents({'type': 'geojson_metadata'})
-    geojson_feature_count = collection.count_documents({'type': 'geojson_feature'})
-    
-    print(f"Total documents in collection: {total_count:,}")
-    print(f"  - Metadata documents: {metadata_count}")
-    print(f"  - Data documents: {data_count:,}")
-    if geojson_metadata_count > 0:
-        print(f"  - GeoJSON metadata documents: {geojson_metadata_count}")
-    if geojson_feature_count > 0:
-        print(f"  - GeoJSON feature documents: {geojson_feature_count:,}")
-    
-except Exception as e:
-    print(f"✗ Error verifying insertion: {e}")
-
 # Create indexes
 print("\n" + "="*60)
 print("Creating indexes...")
 print("="*60)
 
 try:
-    # Index on type for filtering document types
-    print("\nCreating index on 'type' field...")
-    collection.create_index([('type', 1)])
-    print("✓ Index created on type")
-    
-    # Index on time_bucket for time-based queries
-    print("\nCreating index on 'time_bucket' field...")
-    collection.create_index([('time_bucket', 1)])
-    print("✓ Index created on time_bucket")
-    
-    # 2dsphere index on location field for geospatial queries
-    print("\nCreating 2dsphere index on 'location' field...")
-    collection.create_index([('location', GEOSPHERE)])
-    print("✓ 2dsphere index created on location")
-    
-    # Compound index on type + time_bucket
-    print("\nCreating compound index on type + time_bucket...")
-    collection.create_index([('type', 1), ('time_bucket', 1)])
-    print("✓ Compound index created on type + time_bucket")
+    # Build all indexes in one createIndexes command so the server populates
+    # them from a single scan of the collection instead of one scan each
+    index_models = [
+        # Index on type for filtering document types
+        IndexModel([('type', ASCENDING)]),
+        # Index on time_bucket for time-based queries
+        IndexModel([('time_bucket', ASCENDING)]),
+        # 2dsphere index on location field for geospatial queries
+        IndexModel([('location', GEOSPHERE)]),
+        # Compound index on type + time_bucket
+        IndexModel([('type', ASCENDING), ('time_bucket', ASCENDING)]),
+    ]
+    print("\nCreating indexes on type, time_bucket, location (2dsphere) and type + time_bucket...")
+    index_names = collection.create_indexes(index_models)
+    print(f"✓ Created indexes: {', '.join(index_names)}")
     
     print("\n" + "="*60)
     print("Index Creation Complete!")
@@ -383,6 +684,30 @@ except Exception as e:
     import traceback
     traceback.print_exc()
 
+# Verify insertion (after index creation so the per-type counts use the type index)
+print("\n" + "="*60)
+print("Verifying insertion...")
+print("="*60)
+
+try:
+    total_count = collection.estimated_document_count()
+    type_counts = count_by_type(collection)
+    metadata_count = type_counts.get('metadata', 0)
+    data_count = type_counts.get('data', 0)
+    geojson_metadata_count = type_counts.get('geojson_metadata', 0)
+    geojson_feature_count = type_counts.get('geojson_feature', 0)
+    
+    print(f"Total documents in collection: {total_count:,}")
+    print(f"  - Metadata documents: {metadata_count}")
+    print(f"  - Data documents: {data_count:,}")
+    if geojson_metadata_count > 0:
+        print(f"  - GeoJSON metadata documents: {geojson_metadata_count}")
+    if geojson_feature_count > 0:
+        print(f"  - GeoJSON feature documents: {geojson_feature_count:,}")
+    
+except Exception as e:
+    print(f"✗ Error verifying insertion: {e}")
+
 # Test queries
 print("\n" + "="*60)
 print("Testing queries...")
@@ -391,26 +716,36 @@ print("="*60)
 try:
     # Test 1: Count documents by type
     print("\n1. Document counts by type:")
+    type_counts = count_by_type(collection)
     for doc_type in ['metadata', 'data', 'geojson_metadata', 'geojson_feature']:
-        count = collection.count_documents({'type': doc_type})
+        count = type_counts.get(doc_type, 0)
         if count > 0:
             print(f"   {doc_type}: {count:,}")
     
     # Test 2: Sample data document
-    sample_data = collection.find_one({'type': 'data'})
+    sample_data = collection.find_one(
+        {'type': 'data'},
+        {'_id': 0, 'time_bucket': 1, 'location': 1, 'flight_count': 1, 'intensity': 1}
+    )
     if sample_data:
         print(f"\n2. Sample data document:")
         print(f"   Time bucket: {sample_data.get('time_bucket')}")
-        print(f"   Location: ({sample_data.get('lat')}, {sample_data.get('lon')})")
+        lon, lat = sample_data['location']['coordinates']
+        print(f"   Location: ({lat}, {lon})")
         print(f"   Flight count: {sample_data.get('flight_count')}")
         print(f"   Intensity: {sample_data.get('intensity')}")
     
     # Test 3: Sample GeoJSON feature
-    sample_feature = collection.find_one({'type': 'geojson_feature'})
+    sample_feature = collection.find_one(
+        {'type': 'geojson_feature'},
+        {'_id': 0, 'time_bucket': 1, 'location': 1, 'properties': 1}
+    )
     if sample_feature:
         print(f"\n3. Sample GeoJSON feature:")
         print(f"   Time bucket: {sample_feature.get('time_bucket')}")
-        print(f"   Location: ({sample_feature.get('lat')}, {sample_feature.get('lon')})")
+        if 'location' in sample_feature:
+            lon, lat = sample_feature['location']['coordinates']
+            print(f"   Location: ({lat}, {lon})")
         print(f"   Properties: {list(sample_feature.get('properties', {}).keys())}")
     
     # Test 4: Time bucket query
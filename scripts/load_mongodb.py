@@ -116,6 +116,11 @@ print("Counting total rows...")
 total_rows = sum(1 for _ in open(nodes_file)) - 1  # Subtract header
 print(f"Total nodes to insert: {total_rows:,}")
 
+# Persist the ADS-B track/heading when the nodes file carries one, so edge
+# generation can read it instead of deriving it from neighbouring nodes
+# (read the header with pandas: pyarrow-written CSVs quote the column names)
+has_heading = 'heading' in pd.read_csv(nodes_file, nrows=0).columns
+
 # Insert documents in batches
 BATCH_SIZE = 10000  # Process 10,000 documents at a time
 CHUNK_SIZE = 50000  # Read 50,000 rows from CSV at a time for processing
@@ -175,6 +180,8 @@ try:
                 'origin': str(row['origin']),
                 'dest': str(row['dest'])
             }
+            if has_heading and pd.notna(row['heading']):
+                doc['heading'] = float(row['heading'])
             
             current_batch.append(doc)
             
@@ -0,0 +1,66 @@
+"""
+Candidate searches of scripts/generate_formation_edges.py must store the same edges.
+
+The script runs top to bottom on import, so each search mode is run as a script
+against an in-memory mongomock database.
+"""
+
+import builtins
+import os
+import runpy
+from datetime import datetime, timedelta
+
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+pytest.importorskip('scipy')
+import bson
+import pymongo
+from bson.raw_bson import RawBSONDocument
+
+SCRIPT = os.path.join(os.path.dirname(__file__), '..', 'scripts', 'generate_formation_edges.py')
+
+
+def colocated_nodes(flights=13, minutes_apart=10):
+    """One node per flight at the same point, flights minutes_apart apart."""
+    t0 = datetime(2024, 1, 1)
+    return [{'flight_id': f, 'timestamp': t0 + timedelta(minutes=f * minutes_apart),
+             'lat': 40.0, 'lon': -75.0, 'time_index': 0,
+             'location': {'type': 'Point', 'coordinates': [-75.0, 40.0]}}
+            for f in range(flights)]
+
+
+@pytest.fixture(autouse=True)
+def decode_raw_inserts(monkeypatch):
+    """mongomock only inserts dicts: decode the script's encoded edge batches first."""
+    insert_many = mongomock.collection.Collection.insert_many
+
+    def decoding_insert_many(self, docs, *args, **kwargs):
+        docs = [bson.decode(doc.raw) if isinstance(doc, RawBSONDocument) else doc for doc in docs]
+        return insert_many(self, docs, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, 'insert_many', decoding_insert_many)
+
+
+def run_search(monkeypatch, mode, nodes):
+    """Run the script with CANDIDATE_SEARCH=mode and return the stored edge keys."""
+    client = mongomock.MongoClient()
+    client['flights']['flight_nodes'].insert_many([dict(node) for node in nodes])
+    monkeypatch.setattr(pymongo, 'MongoClient', lambda *args, **kwargs: client)
+    monkeypatch.setattr(builtins, 'input', lambda *args: 'n')
+    monkeypatch.setenv('CANDIDATE_SEARCH', mode)
+    monkeypatch.setenv('NODE_SAMPLING_RATE', '1')
+    monkeypatch.setenv('NUM_WORKERS', '1')
+    runpy.run_path(SCRIPT, run_name='__main__')
+    return sorted((e['flight1_id'], e['flight2_id'], e['timestamp1'], e['timestamp2'])
+                  for e in client['flights']['formation_edges'].find())
+
+
+def test_kdtree_matches_window(monkeypatch):
+    nodes = colocated_nodes()
+    window_edges = run_search(monkeypatch, 'window', nodes)
+    kdtree_edges = run_search(monkeypatch, 'kdtree', nodes)
+
+    # Pairs 10 and 20 minutes apart only: a block slides the window over every node
+    assert len(window_edges) == 12 + 11
+    assert kdtree_edges == window_edges